@@ -0,0 +1,264 @@
+# End-to-end benchmark of the body.py pipeline with synthetic JPEG camera streams
+#
+#   python benchmark.py --streams 8 --fps 60 --model stub        (pipeline overhead without the model)
+#   python benchmark.py --streams 4 --model mediapipe --output results.json
+#
+# Frames travel the real path: chunked UDP -> UDPFrameReceiver -> decode -> BodyThread ->
+# LandmarkSmoother -> serialization -> ClientUDP, and are timed from capture stamp to landmark
+# packet arrival at a local sink. CPU figures cover the whole benchmark process, synthetic sender
+# and sink included, so compare them across commits rather than reading them as absolute cost.
+import argparse
+import json
+import platform
+import selectors
+import socket
+import subprocess
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import global_vars
+from body import BodyThread, UDPFrameReceiver
+from frame_protocol import frame_chunks
+from ingest import IngestLoop
+from landmark_codec import decode_binary
+
+# Debug prefix for easy removal
+DEBUG_PREFIX = "DEBUG_"
+
+SYNTHETIC_FRAMES = 30  # Distinct frames per stream, encoded up front so the sender stays cheap
+
+
+class StubLandmark:
+    __slots__ = ('x', 'y', 'z', 'visibility')
+
+    def __init__(self, x, y, z):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.visibility = 1.0
+
+
+class StubLandmarkList:
+    def __init__(self, landmarks):
+        self.landmark = landmarks
+
+
+class StubResults:
+    def __init__(self, world_landmarks):
+        self.pose_world_landmarks = world_landmarks
+        self.pose_landmarks = world_landmarks
+
+
+class StubPose:
+    # Stands in for mp.solutions.pose.Pose: deterministic landmarks from a cheap look at the image,
+    # so the benchmark measures everything except the model
+    def __init__(self):
+        self.base = np.linspace(-0.5, 0.5, 33 * 3, dtype=np.float32).reshape(33, 3)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def process(self, image):
+        shift = float(image[0, 0, 0]) / 2550.0
+        points = (self.base + shift).tolist()
+        return StubResults(StubLandmarkList([StubLandmark(x, y, z) for x, y, z in points]))
+
+
+def synthetic_frames(width, height, count, seed):
+    # Moving gradients plus noise, so JPEG sizes are close to a real camera's
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frames = []
+    for i in range(count):
+        image = np.empty((height, width, 3), np.uint8)
+        image[..., 0] = (x + i * 8) % 256
+        image[..., 1] = (y + i * 4) % 256
+        image[..., 2] = rng.integers(0, 64, (height, width), dtype=np.uint8) + 96
+        image[:16, :16] = (i * 8) % 256  # Lets the stub model's output vary per frame
+        _, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        frames.append(jpeg.tobytes())
+    return frames
+
+
+class SyntheticSender(threading.Thread):
+    # Paces all streams from one thread at the target fps
+    def __init__(self, ports, width, height, fps):
+        super().__init__()
+        self.daemon = True
+        self.ports = ports
+        self.fps = fps
+        self.frames = [synthetic_frames(width, height, SYNTHETIC_FRAMES, port) for port in ports]
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+        self.sent = 0
+
+    def run(self):
+        interval = 1.0 / self.fps
+        next_time = time.time()
+        frame_id = 0
+        while not global_vars.KILL_THREADS:
+            for stream, port in enumerate(self.ports):
+                data = self.frames[stream][frame_id % SYNTHETIC_FRAMES]
+                for chunk in frame_chunks(stream, frame_id, data, time.time()):
+                    self.sock.sendto(chunk, ('127.0.0.1', port))
+            self.sent += len(self.ports)
+            frame_id += 1
+            next_time += interval
+            delay = next_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.time()  # Fell behind, don't try to catch up in a burst
+
+
+class LandmarkSink(threading.Thread):
+    # Receives the landmark packets and records capture-to-arrival latency per output port
+    def __init__(self, ports):
+        super().__init__()
+        self.daemon = True
+        self.selector = selectors.DefaultSelector()
+        self.latencies = {port: [] for port in ports}
+        self.recording = False
+        for port in ports:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(('127.0.0.1', port))
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ, port)
+
+    def run(self):
+        while not global_vars.KILL_THREADS:
+            for key, _ in self.selector.select(timeout=0.1):
+                while True:
+                    try:
+                        data = key.fileobj.recv(4096)
+                    except BlockingIOError:
+                        break
+                    now = time.time()
+                    if self.recording:
+                        self.latencies[key.data].append(now - decode_binary(data).capture_ts)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(streams, width, height, fps, duration, warmup, model, base_port):
+    global_vars.HOST = '127.0.0.1'
+    global_vars.OUTPUT_FORMAT = "binary"
+    global_vars.STALE_FRAME_DEADLINE_MS = 0
+
+    input_ports = [base_port + i for i in range(streams)]
+    output_ports = [global_vars.get_output_port(port) for port in input_ports]
+    pose_factory = StubPose if model == "stub" else None
+
+    sink = LandmarkSink(output_ports)
+    ingest = IngestLoop()
+    threads = []
+    for input_port, output_port in zip(input_ports, output_ports):
+        receiver = UDPFrameReceiver(input_port)
+        ingest.add(receiver)
+        threads.append(BodyThread(input_port, output_port, receiver, pose_factory))
+    sender = SyntheticSender(input_ports, width, height, fps)
+
+    sink.start()
+    ingest.start()
+    for thread in threads:
+        thread.start()
+    sender.start()
+
+    time.sleep(warmup)
+    sent_before = sender.sent
+    cpu_before = time.process_time()
+    wall_before = time.time()
+    sink.recording = True
+    time.sleep(duration)
+    sink.recording = False
+    wall = time.time() - wall_before
+    cpu = time.process_time() - cpu_before
+    sent = sender.sent - sent_before
+    global_vars.KILL_THREADS = True
+
+    per_stream = []
+    all_latencies = []
+    for input_port, output_port in zip(input_ports, output_ports):
+        latencies = sink.latencies[output_port]
+        all_latencies.extend(latencies)
+        per_stream.append({
+            "input_port": input_port,
+            "landmark_fps": len(latencies) / wall,
+            "latency_p50_ms": ms(percentile(latencies, 50)),
+            "latency_p99_ms": ms(percentile(latencies, 99)),
+        })
+
+    return {
+        "config": {"streams": streams, "width": width, "height": height, "fps": fps,
+                   "duration": duration, "model": model},
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "frames_sent": sent,
+        "landmarks_received": len(all_latencies),
+        "throughput_fps": len(all_latencies) / wall,
+        "latency_p50_ms": ms(percentile(all_latencies, 50)),
+        "latency_p99_ms": ms(percentile(all_latencies, 99)),
+        "cpu_percent": cpu / wall * 100,
+        "cpu_percent_per_stream": cpu / wall * 100 / streams,
+        "streams_detail": per_stream,
+    }
+
+
+def ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pose pipeline with synthetic camera streams")
+    parser.add_argument('--streams', type=int, default=len(global_vars.INPUT_PORTS))
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--duration', type=float, default=10.0, help="measured seconds")
+    parser.add_argument('--warmup', type=float, default=2.0, help="seconds before measuring")
+    parser.add_argument('--model', choices=("stub", "mediapipe"), default="stub")
+    parser.add_argument('--base-port', type=int, default=53700)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.streams, args.width, args.height, args.fps, args.duration,
+                            args.warmup, args.model, args.base_port)
+
+    print(f"{DEBUG_PREFIX}{args.streams} streams @ {args.fps} fps ({args.width}x{args.height}, {args.model} model)")
+    print(f"{DEBUG_PREFIX}Throughput: {results['throughput_fps']:.1f} landmark packets/s "
+          f"of {results['frames_sent'] / args.duration:.1f} frames/s sent")
+    if results['latency_p50_ms'] is not None:
+        print(f"{DEBUG_PREFIX}Latency: p50 {results['latency_p50_ms']:.1f}ms, p99 {results['latency_p99_ms']:.1f}ms")
+    print(f"{DEBUG_PREFIX}CPU: {results['cpu_percent']:.0f}% total, {results['cpu_percent_per_stream']:.1f}% per stream")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"{DEBUG_PREFIX}Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,20 @@
 # MediaPipe Body - Optimized Version
-import mediapipe as mp
-from mediapipe.tasks import python
-from mediapipe.tasks.python import vision
+# mediapipe is imported by create_pose(), so sockets are bound and buffering before it loads
 from clientUDP import ClientUDP
 import cv2
+import os
 import threading
 import time
 import global_vars
-import struct
 import socket
 import numpy as np
 from collections import deque
+from metrics import stream_metrics
+from landmark_codec import encode_text, encode_binary, QuantizedLandmarkEncoder
+from output_scheduler import LandmarkTrack, get_output_scheduler
+from frame_protocol import (HEADER_SIZE, FRAME_ID_MODULO, KIND_CHUNK, KIND_PING, KIND_SHM_FRAME, ProtocolError,
+                            StreamFeedback, unpack_header, frame_id_newer, pack_pong, pack_feedback)
+from shm_transport import SharedFrameReader
 
 # Debug prefix for easy removal
 DEBUG_PREFIX = "DEBUG_"
@@ -20,30 +24,283 @@ MAX_BUFFER_SIZE = 512 * 1024  # Reduced buffer size
 PROCESS_WIDTH = 320  # Increased resolution for better accuracy
 PROCESS_HEIGHT = 240
 MAX_QUEUE_SIZE = 3  # Reduced queue size for lower latency
+INCOMPLETE_FRAME_TIMEOUT = 0.2  # Drop frames still missing chunks after this many seconds
+STREAM_RESTART_WINDOW = 256  # Frame id jumps larger than this mean the sender restarted
+FRAME_SLOTS = MAX_QUEUE_SIZE + 5  # Queued frames + frames being reassembled + one being decoded
+
+DECODE_WORKERS = 2  # Shared by all receivers; cv2.imdecode releases the GIL
+MAX_DRAIN_DATAGRAMS = 64  # Per socket per wakeup in selector ingest mode
+SHM_REATTACH_MISSES = 30  # Shared memory notifications in a row without a new frame before reattaching
+SHM_RETRY_INTERVAL = 5.0  # Seconds before trying again to attach a ring that couldn't be attached
+FEEDBACK_MIN_WINDOW = 0.5  # Pings closer together than this get the previous feedback again
+
+# Scatter receive lets the kernel write chunk payloads straight into frame slots (not on Windows)
+HAS_RECVMSG_INTO = hasattr(socket.socket, 'recvmsg_into')
+
+# Frame handoff
+FRAME_WAIT_TIMEOUT = 0.5  # Longest a body thread blocks waiting for a frame before re-checking for shutdown
+IDLE_TIMEOUT = 1.0  # Seconds without frames before a stream is reported idle
+
+# Latency tracing
+CLOCK_SKEW_TOLERANCE = 0.05  # Capture timestamps this far in the future are still trusted
+MAX_TRUSTED_AGE = 10.0  # Older than this means the sender never synced its clock
+
+# Inference scheduling (global_vars.FAIR_SCHEDULING)
+SCHEDULER_WAIT = 0.05  # Longest a waiting stream sleeps before checking for a newer frame
+SCHEDULER_REPORT_INTERVAL = 5.0
+MIN_INFERENCE_COST = 0.001  # Charged per turn before a stream's cost has been measured
+COST_SMOOTHING = 0.2  # Weight of each new inference time once the first few have been averaged
+
+# Motion gating (global_vars.MOTION_GATE)
+MOTION_GATE_WIDTH = 32
+MOTION_GATE_HEIGHT = 24
+
+# Stream states
+STREAM_ACTIVE = "active"
+STREAM_IDLE = "idle"
+STREAM_PARKED = "parked"  # Idle long enough that the pose model was released
 
 # Smoothing parameters
 SMOOTHING_FACTOR = 0.7  # Higher = more smoothing
 MIN_MOVEMENT_THRESHOLD = 0.001  # Ignore tiny movements
+SMOOTHING_MODE = "ema"  # "ema" or "one_euro"
+
+# One-Euro filter parameters (world landmarks are in meters)
+ONE_EURO_MIN_CUTOFF = 1.0  # Hz, lower = less jitter when still
+ONE_EURO_BETA = 0.5  # Higher = less lag on fast moves
+ONE_EURO_D_CUTOFF = 1.0  # Hz, cutoff for the speed estimate
+
+class FrameSlot:
+    # Preallocated storage for one encoded frame, reused for the life of the receiver
+    def __init__(self, size=MAX_BUFFER_SIZE):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.received = []
+        self.reset(None, 0.0)
+
+    def reset(self, header, now):
+        self.stream_id = header.stream_id if header else 0
+        self.frame_id = header.frame_id if header else 0
+        self.capture_ts = header.capture_ts if header else 0.0
+        self.chunk_count = header.chunk_count if header else 0
+        self.size = header.frame_size if header else 0
+        self.received[:] = [False] * self.chunk_count
+        self.remaining = self.chunk_count
+        self.first_seen = now
+
+    def payload(self):
+        return self.view[:self.size]
+
+
+class FrameSlotRing:
+    # Fixed pool of frame slots shared by the receiver (filling) and the consumer (decoding)
+    def __init__(self, count=FRAME_SLOTS, size=MAX_BUFFER_SIZE):
+        self.slots = [FrameSlot(size) for _ in range(count)]
+        self.free = deque(self.slots)
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            return self.free.popleft() if self.free else None
+
+    def release(self, slot):
+        with self.lock:
+            self.free.append(slot)
+
+
+class StreamStats:
+    def __init__(self):
+        self.frames_completed = 0
+        self.frames_incomplete = 0
+        self.frames_missing = 0  # Frame ids that never showed up at all
+        self.frames_overrun = 0  # No free slot to reassemble into
+        self.frames_dropped = 0  # Completed but replaced by a newer frame before decode
+        self.chunks_received = 0
+        self.chunks_reordered = 0
+        self.chunks_late = 0
+        self.chunks_invalid = 0
+
+    def loss_rate(self):
+        expected = self.frames_completed + self.frames_incomplete + self.frames_missing + self.frames_overrun
+        lost = self.frames_incomplete + self.frames_missing + self.frames_overrun
+        return lost / expected if expected else 0.0
+
+    def reorder_rate(self):
+        return self.chunks_reordered / self.chunks_received if self.chunks_received else 0.0
+
+
+class FeedbackMeter:
+    # Rates over the window since the previous report, sent back to senders so they can match what
+    # this port actually gets through. Reads the body thread's metrics, which share the port's label.
+    def __init__(self, stats, metrics):
+        self.stats = stats
+        self.metrics = metrics
+        self.last_counters = self.counters()
+        self.last_time = time.time()
+        self.report = None
+
+    def counters(self):
+        stats = self.stats
+        sent = self.metrics.ages['sent']
+        processed = self.metrics.stages['inference'].count + self.metrics.counters.get('frames_gated', 0)
+        lost = stats.frames_incomplete + stats.frames_missing + stats.frames_overrun
+        return stats.frames_completed, stats.frames_dropped, lost, processed, sent.sum, sent.count
+
+    def feedback(self, now):
+        # None until the first window has passed. Several senders on one port share a window
+        # rather than each getting a sliver of it.
+        elapsed = now - self.last_time
+        if elapsed < FEEDBACK_MIN_WINDOW:
+            return self.report
+        counters = self.counters()
+        completed, dropped, lost, processed, latency_sum, latency_count = (
+            current - last for current, last in zip(counters, self.last_counters))
+        self.report = StreamFeedback(completed / elapsed, processed / elapsed,
+                                     min(1.0, dropped / completed) if completed else 0.0,
+                                     lost / (completed + lost) if completed + lost else 0.0,
+                                     latency_sum / latency_count if latency_count else 0.0,
+                                     PROCESS_WIDTH, PROCESS_HEIGHT)
+        self.last_counters = counters
+        self.last_time = now
+        return self.report
+
 
-class FrameBuffer:
-    def __init__(self, max_size=MAX_BUFFER_SIZE):
-        self.buffer = bytearray()
-        self.max_size = max_size
+class StreamReassembler:
+    # Reassembles the chunks of one sender stream into slots of the receiver's ring
+    def __init__(self, stats, ring, timeout=INCOMPLETE_FRAME_TIMEOUT):
+        self.stats = stats
+        self.ring = ring
+        self.timeout = timeout
+        self.pending = {}
+        self.newest_frame_id = None
+        self.newest_capture_ts = 0.0
+        self.last_chunk = None
+        self.last_chunk_time = 0.0
 
-    def add(self, data):
-        if len(self.buffer) + len(data) > self.max_size:
-            self.clear()
-        self.buffer.extend(data)
+    def slot_for(self, header, now):
+        # Returns the slot the chunk's payload belongs in, or None if it should be discarded
+        stats = self.stats
+        stats.chunks_received += 1
 
-    def clear(self):
-        self.buffer = bytearray()
+        last = self.last_chunk
+        if last is not None:
+            if header.frame_id == last[0]:
+                reordered = header.chunk_index < last[1]
+            else:
+                reordered = frame_id_newer(last[0], header.frame_id)
+            if reordered:
+                stats.chunks_reordered += 1
+        self.last_chunk = (header.frame_id, header.chunk_index)
+        silent = now - self.last_chunk_time > self.timeout
+        self.last_chunk_time = now
 
-class UDPFrameReceiver(threading.Thread):
+        slot = self.pending.get(header.frame_id)
+        if slot is None:
+            if header.frame_size > MAX_BUFFER_SIZE:
+                stats.chunks_invalid += 1
+                return None
+            if self.newest_frame_id is not None:
+                distance = (header.frame_id - self.newest_frame_id) % FRAME_ID_MODULO
+                late = distance > FRAME_ID_MODULO - STREAM_RESTART_WINDOW or distance == 0
+                # After a silence, or with a newer capture time, an "old" id means the sender
+                # restarted its ids from 0 rather than a late chunk
+                restarted = silent or 0 < self.newest_capture_ts < header.capture_ts
+                if late and not restarted:
+                    # Chunk of a frame we already completed or dropped
+                    stats.chunks_late += 1
+                    return None
+                if late:
+                    self.drop_pending(lambda frame_id: True)
+                elif distance <= STREAM_RESTART_WINDOW:
+                    stats.frames_missing += distance - 1
+                else:
+                    # Sender restarted and its frame ids jumped, start over
+                    self.drop_pending(lambda frame_id: True)
+            self.newest_frame_id = header.frame_id
+            self.newest_capture_ts = header.capture_ts
+            slot = self.ring.acquire()
+            if slot is None:
+                stats.frames_overrun += 1
+                return None
+            slot.reset(header, now)
+            self.pending[header.frame_id] = slot
+
+        if header.frame_size != slot.size or header.chunk_count != slot.chunk_count:
+            stats.chunks_invalid += 1
+            return None
+        if slot.received[header.chunk_index]:
+            stats.chunks_late += 1
+            return None
+        return slot
+
+    def commit(self, slot, header, payload_size):
+        # Mark a chunk as written into its slot; returns the slot once the frame is complete
+        if header.offset + payload_size > slot.size:
+            self.stats.chunks_invalid += 1
+            self.drop_pending(lambda frame_id: frame_id == header.frame_id)
+            return None
+        slot.received[header.chunk_index] = True
+        slot.remaining -= 1
+        if slot.remaining:
+            return None
+
+        del self.pending[header.frame_id]
+        # Anything older than a completed frame can only ever produce a stale image
+        self.drop_pending(lambda frame_id: frame_id_newer(header.frame_id, frame_id))
+        self.stats.frames_completed += 1
+        return slot
+
+    def drop_pending(self, predicate):
+        for frame_id in [f for f in self.pending if predicate(f)]:
+            self.ring.release(self.pending.pop(frame_id))
+            self.stats.frames_incomplete += 1
+
+    def expire(self, now):
+        timeout = self.timeout
+        self.drop_pending(lambda frame_id: now - self.pending[frame_id].first_seen > timeout)
+
+
+class DecodedFrameSource:
+    # Hands decoded frames to a BodyThread, newest wins. Shared by UDPFrameReceiver and
+    # ws_ingest.WebSocketFrameSource; subclasses set self.stats.
+    def __init__(self):
+        super().__init__()
+        self.decoded = None
+        self.decoded_ready = threading.Condition(threading.Lock())
+
+    def publish_decoded(self, frame):
+        with self.decoded_ready:
+            if self.decoded is not None:
+                if frame_id_newer(self.decoded.frame_id, frame.frame_id):
+                    return  # Another worker already published a newer frame
+                self.stats.frames_dropped += 1
+            self.decoded = frame
+            self.decoded_ready.notify()
+
+    def get_decoded(self, timeout=0.0):
+        # Newest DecodedFrame, blocking up to timeout for one to arrive
+        with self.decoded_ready:
+            if self.decoded is None and not self.decoded_ready.wait_for(lambda: self.decoded is not None, timeout):
+                return None
+            decoded, self.decoded = self.decoded, None
+        return decoded
+
+    def get_frame(self, timeout=0.0):
+        decoded = self.get_decoded(timeout)
+        return decoded.image if decoded is not None else None
+
+
+class UDPFrameReceiver(DecodedFrameSource, threading.Thread):
     def __init__(self, port):
         super().__init__()
         self.port = port
-        self.frame_queue = deque(maxlen=MAX_QUEUE_SIZE)
+        self.frame_queue = deque()
+        self.frame_ready = threading.Condition(threading.Lock())
+        # Decoded frames are published by the shared DecodeStage
+        self.decoder = get_decode_stage()
+        self.decode_pending = False
         self.isRunning = False
+        self.stopped = False
         self.daemon = True
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         
@@ -56,122 +313,787 @@ class UDPFrameReceiver(threading.Thread):
             self.sock.bind((global_vars.HOST, self.port))
         except Exception as e:
             print(f"{DEBUG_PREFIX}Failed to bind to port {self.port}: {e}")
-            return
+            self.sock.close()
+            raise
             
-        self.frame_buffer = FrameBuffer()
+        # Datagrams land directly in ring slots; these scratch buffers are only for headers
+        # and for datagrams that get discarded
+        self.ring = FrameSlotRing()
+        self.header_buf = bytearray(HEADER_SIZE)
+        self.header_view = memoryview(self.header_buf)
+        self.scratch_buf = bytearray(65536)
+        self.scratch_view = memoryview(self.scratch_buf)
+
+        self.stats = StreamStats()
+        self.metrics = stream_metrics(self.port)
+        self.metrics.stats = self.stats
+        self.feedback = FeedbackMeter(self.stats, self.metrics)
+        self.reassemblers = {}  # stream id -> StreamReassembler
+        self.shared_readers = {}  # stream id -> SharedFrameReader, for same-host senders
+        self.shared_unavailable = {}  # stream id -> time attaching its ring last failed
         self.frame_count = 0
         self.last_stats_time = time.time()
         print(f"{DEBUG_PREFIX}UDP receiver started on port {self.port}")
 
+    def reassembler_for(self, stream_id):
+        reassembler = self.reassemblers.get(stream_id)
+        if reassembler is None:
+            reassembler = StreamReassembler(self.stats, self.ring)
+            self.reassemblers[stream_id] = reassembler
+        return reassembler
+
+    def receive_datagram(self, now):
+        if not HAS_RECVMSG_INTO:
+            nbytes, addr = self.sock.recvfrom_into(self.scratch_buf)
+            self.handle_datagram(self.scratch_view[:nbytes], now, addr)
+            return
+
+        # Peek at the header to find where the payload belongs, then scatter the datagram
+        # so the payload is written by the kernel straight into its frame slot
+        nbytes = self.sock.recv_into(self.header_buf, HEADER_SIZE, socket.MSG_PEEK)
+        try:
+            header = unpack_header(self.header_view[:nbytes])
+        except ProtocolError:
+            self.stats.chunks_invalid += 1
+            header = None
+        slot = None
+        if header is not None and header.kind == KIND_CHUNK:
+            reassembler = self.reassembler_for(header.stream_id)
+            slot = reassembler.slot_for(header, now)
+        if slot is None:
+            _, addr = self.sock.recvfrom_into(self.scratch_buf)
+            if header is not None and header.kind != KIND_CHUNK:
+                self.handle_control(header, addr)
+            return
+
+        nbytes, _, flags, _ = self.sock.recvmsg_into([self.header_buf, slot.view[header.offset:slot.size]])
+        if flags & socket.MSG_TRUNC:
+            nbytes = slot.size + HEADER_SIZE + 1  # Force the overrun check to reject it
+        self.complete_chunk(reassembler, slot, header, nbytes - HEADER_SIZE)
+
+    def handle_datagram(self, data, now, addr=None):
+        # Copying path for platforms without recvmsg_into and for datagrams that are already in memory
+        try:
+            header = unpack_header(data)
+        except ProtocolError:
+            self.stats.chunks_invalid += 1
+            return
+        if header.kind != KIND_CHUNK:
+            self.handle_control(header, addr)
+            return
+
+        reassembler = self.reassembler_for(header.stream_id)
+        slot = reassembler.slot_for(header, now)
+        if slot is None:
+            return
+        payload = data[HEADER_SIZE:]
+        slot.view[header.offset:header.offset + len(payload)] = payload
+        self.complete_chunk(reassembler, slot, header, len(payload))
+
+    def handle_control(self, header, addr):
+        if header.kind == KIND_SHM_FRAME:
+            self.read_shared_frame(header)
+        elif header.kind == KIND_PING and addr is not None:
+            # Answer clock pings so senders can stamp frames in this machine's clock, and tell
+            # them how the stream is keeping up so they can adapt what they send
+            now = time.time()
+            feedback = self.feedback.feedback(now)
+            try:
+                self.sock.sendto(pack_pong(header, now), addr)
+                if feedback is not None:
+                    self.sock.sendto(pack_feedback(header.stream_id, feedback), addr)
+            except OSError:
+                pass
+
+    def complete_chunk(self, reassembler, slot, header, payload_size):
+        slot = reassembler.commit(slot, header, payload_size)
+        if slot is None:
+            return
+        now = time.time()
+        self.metrics.observe('reassembly', now - slot.first_seen)
+        self.metrics.observe_age('reassembled', frame_age(slot.capture_ts, now))
+        with self.frame_ready:
+            # Newest frame wins; older queued frames go back to the ring undecoded
+            while len(self.frame_queue) >= MAX_QUEUE_SIZE:
+                self.ring.release(self.frame_queue.popleft())
+                self.stats.frames_dropped += 1
+            self.frame_queue.append(slot)
+            self.frame_ready.notify()
+        self.decoder.schedule(self)
+        self.frame_count += 1
+
+    def drain(self, now):
+        # Read what is queued on a non-blocking socket, bounded so one busy port can't starve the others
+        recv_histogram = self.metrics.stages['recv']
+        for _ in range(MAX_DRAIN_DATAGRAMS):
+            start = time.perf_counter()
+            try:
+                self.receive_datagram(now)
+            except BlockingIOError:
+                break
+            recv_histogram.observe(time.perf_counter() - start)
+
+    def expire_frames(self, now):
+        for reassembler in self.reassemblers.values():
+            reassembler.expire(now)
+
+    def housekeeping(self, now):
+        self.expire_frames(now)
+        # Print stats less frequently
+        if now - self.last_stats_time >= 2:  # Every 2 seconds
+            self.print_stats(now)
+
+    def print_stats(self, now):
+        fps = self.frame_count / (now - self.last_stats_time)
+        print(f"{DEBUG_PREFIX}Port {self.port}: {fps:.1f} FPS, "
+              f"loss {self.stats.loss_rate() * 100:.1f}%, reorder {self.stats.reorder_rate() * 100:.1f}%, "
+              f"incomplete {self.stats.frames_incomplete}")
+        self.frame_count = 0
+        self.last_stats_time = now
+
+    def stop(self):
+        # Threaded mode only; in selector mode the IngestLoop owns the socket
+        self.stopped = True
+
     def run(self):
         self.isRunning = True
-        consecutive_timeouts = 0
-        
-        while not global_vars.KILL_THREADS and consecutive_timeouts < 50:  # Exit after 5 seconds of no data
-            try:
-                data, _ = self.sock.recvfrom(65536)
-                consecutive_timeouts = 0  # Reset timeout counter
-                
-                if data.startswith(b'FRAME_START'):
-                    self.frame_buffer.clear()
-                elif data.startswith(b'FRAME_END'):
-                    if len(self.frame_queue) < MAX_QUEUE_SIZE:
-                        self.frame_queue.append(self.frame_buffer.buffer[:])
-                    self.frame_buffer.clear()
-                    self.frame_count += 1
-                else:
-                    self.frame_buffer.add(data)
 
-                # Print stats less frequently
-                if time.time() - self.last_stats_time >= 2:  # Every 2 seconds
-                    fps = self.frame_count / 2
-                    print(f"{DEBUG_PREFIX}Port {self.port}: {fps:.1f} FPS")
-                    self.frame_count = 0
-                    self.last_stats_time = time.time()
+        # A silent camera is not a reason to stop: it may start sending again at any time
+        while not global_vars.KILL_THREADS and not self.stopped:
+            try:
+                now = time.time()
+                self.receive_datagram(now)  # Blocking, so 'recv' timing is only recorded by drain()
+                self.housekeeping(now)
 
             except socket.timeout:
-                consecutive_timeouts += 1
+                self.expire_frames(time.time())
                 continue
             except Exception as e:
                 print(f"{DEBUG_PREFIX}UDP error on port {self.port}: {e}")
-                consecutive_timeouts += 1
-                
+
+        self.isRunning = False
         self.sock.close()
+        self.close_shared_frames()
         print(f"{DEBUG_PREFIX}UDP receiver stopped on port {self.port}")
 
-    def get_frame(self):
-        if not self.frame_queue:
-            return None
+    def take_newest_slot(self, timeout=0.0):
+        # Blocks up to timeout for a complete frame; anything older than the newest is released undecoded
+        with self.frame_ready:
+            if not self.frame_queue and not self.frame_ready.wait_for(lambda: self.frame_queue, timeout):
+                return None
+            slot = self.frame_queue.pop()
+            while self.frame_queue:
+                self.ring.release(self.frame_queue.popleft())
+                self.stats.frames_dropped += 1
+        return slot
+
+    def decode_newest(self):
+        # Runs on a DecodeStage worker: decode only the newest complete frame, older ones were never decoded
+        slot = self.take_newest_slot()
+        if slot is None:
+            return
+        frame_id = slot.frame_id
+        capture_ts = slot.capture_ts
         try:
-            buffer = self.frame_queue.popleft()
-            np_arr = np.frombuffer(buffer, np.uint8)
-            frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-            if frame is not None:
-                # Resize for processing
-                frame = cv2.resize(frame, (PROCESS_WIDTH, PROCESS_HEIGHT), interpolation=cv2.INTER_LINEAR)
-            return frame
+            if is_stale(frame_age(capture_ts, time.time())):
+                self.metrics.inc('frames_stale')
+                return
+            image = decode_jpeg(slot.payload(), self.metrics)
         except Exception as e:
             print(f"{DEBUG_PREFIX}Frame decode error on port {self.port}: {e}")
+            return
+        finally:
+            self.ring.release(slot)
+        if image is None:
+            return
+        self.metrics.observe_age('decoded', frame_age(capture_ts, time.time()))
+        self.publish_decoded(DecodedFrame(image, slot.stream_id, frame_id, capture_ts))
+
+    def read_shared_frame(self, header):
+        # A same-host sender put a raw frame, already at PROCESS_WIDTH x PROCESS_HEIGHT, in shared
+        # memory: copy the newest one out, no reassembly or decode needed
+        reader = self.shared_readers.get(header.stream_id)
+        if reader is None:
+            # A ring we can't open (sender on another host or user) is retried now and then,
+            # not on every notification; the sender falls back to UDP when no frames get through
+            failed = self.shared_unavailable.get(header.stream_id)
+            now = time.time()
+            if failed is not None and now - failed < SHM_RETRY_INTERVAL:
+                return
+            try:
+                reader = SharedFrameReader(self.port, header.stream_id)
+            except (OSError, ValueError) as e:
+                if failed is None:
+                    print(f"{DEBUG_PREFIX}Shared memory frames on port {self.port} unavailable: {e}")
+                self.shared_unavailable[header.stream_id] = now
+                self.stats.chunks_invalid += 1
+                return
+            self.shared_unavailable.pop(header.stream_id, None)
+            self.shared_readers[header.stream_id] = reader
+        start = time.perf_counter()
+        latest = reader.read_latest()
+        if latest is None:
+            if reader.misses >= SHM_REATTACH_MISSES:
+                # Notifications keep coming but the ring doesn't move: the sender is writing a new block
+                reader.close()
+                del self.shared_readers[header.stream_id]
+            return
+        image, frame_id, capture_ts = latest
+        self.metrics.observe('decode', time.perf_counter() - start)
+        self.stats.frames_completed += 1
+        self.frame_count += 1
+        age = frame_age(capture_ts, time.time())
+        if is_stale(age):
+            self.metrics.inc('frames_stale')
+            return
+        self.metrics.observe_age('decoded', age)
+        self.publish_decoded(DecodedFrame(image, header.stream_id, frame_id, capture_ts))
+
+    def close_shared_frames(self):
+        for reader in self.shared_readers.values():
+            reader.close()
+        self.shared_readers = {}
+
+class DecodedFrame:
+    __slots__ = ('image', 'stream_id', 'frame_id', 'capture_ts')
+
+    def __init__(self, image, stream_id, frame_id, capture_ts):
+        self.image = image
+        self.stream_id = stream_id
+        self.frame_id = frame_id
+        self.capture_ts = capture_ts  # In this machine's clock when the sender synced, 0 if unknown
+
+def frame_age(capture_ts, now):
+    # Seconds since capture, or None when there is no timestamp or the sender's clock is clearly off
+    if capture_ts <= 0:
+        return None
+    age = now - capture_ts
+    if age < -CLOCK_SKEW_TOLERANCE or age > MAX_TRUSTED_AGE:
+        return None
+    return max(age, 0.0)
+
+def is_stale(age):
+    deadline = global_vars.STALE_FRAME_DEADLINE_MS
+    return bool(deadline) and age is not None and age * 1000 > deadline
+
+class DecodeStage:
+    # Worker threads that decode frames for many receivers, overlapping decode with pose inference.
+    # A receiver is queued at most once however many frames complete before a worker gets to it.
+    def __init__(self, worker_count=DECODE_WORKERS):
+        self.queue = deque()
+        self.ready = threading.Condition(threading.Lock())
+        self.workers = [threading.Thread(target=self.run, daemon=True) for _ in range(worker_count)]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def schedule(self, receiver):
+        with self.ready:
+            if receiver.decode_pending:
+                return
+            receiver.decode_pending = True
+            self.queue.append(receiver)
+            self.ready.notify()
+
+    def run(self):
+        while not global_vars.KILL_THREADS:
+            with self.ready:
+                if not self.ready.wait_for(lambda: self.queue, FRAME_WAIT_TIMEOUT):
+                    continue
+                receiver = self.queue.popleft()
+                receiver.decode_pending = False
+            receiver.decode_newest()
+
+shared_decode_stage = None
+shared_decode_lock = threading.Lock()
+
+def get_decode_stage():
+    global shared_decode_stage
+    with shared_decode_lock:
+        if shared_decode_stage is None:
+            shared_decode_stage = DecodeStage()
+            shared_decode_stage.start()
+        return shared_decode_stage
+
+class StreamShare:
+    # One stream's standing with the InferenceScheduler
+    def __init__(self, stream, weight, target_fps):
+        self.stream = stream
+        self.weight = weight
+        self.interval = 1.0 / target_fps if target_fps else 0.0
+        self.metrics = stream_metrics(stream)
+        self.virtual_time = 0.0  # Inference seconds received, divided by weight
+        self.last_start = 0.0
+        self.cost = 0.0  # Running estimate of one inference, seconds
+        self.cost_samples = 0
+        self.request = None  # Newest frame waiting for a turn
+        self.granted = False
+        self.scheduled = 0
+        self.missed = 0
+        self.superseded = 0
+
+class InferenceScheduler:
+    # Decides which stream runs inference next once more frames are ready than there are CPU
+    # slots. Streams are served in start-time fair queueing order on estimated inference cost over
+    # weight, are not started faster than their target fps, and a waiting frame that passes the
+    # stale deadline (capture to inference start) before its turn comes is dropped instead of run.
+    def __init__(self, slots=None):
+        self.slots = slots or global_vars.INFERENCE_SLOTS or os.cpu_count() or 1
+        self.running = 0
+        self.shares = {}
+        self.virtual_time = 0.0  # Start tag of the last grant; streams coming back from idle start here
+        self.cond = threading.Condition(threading.Lock())
+        self.last_report = time.time()
+
+    def register(self, stream):
+        share = StreamShare(stream, global_vars.STREAM_WEIGHTS.get(stream, 1.0),
+                            global_vars.STREAM_TARGET_FPS.get(stream, global_vars.TARGET_FPS))
+        with self.cond:
+            self.shares[stream] = share
+        return share
+
+    def unregister(self, share):
+        with self.cond:
+            self.shares.pop(share.stream, None)
+            self.cond.notify_all()
+
+    def wait_turn(self, share, frame, newer_frame):
+        # Blocks until the stream may run inference; returns the frame to run or None if it was
+        # dropped for missing its deadline. newer_frame() is polled between waits, outside the lock
+        # so streams don't poll their receivers one at a time, and may replace the waiting frame.
+        started = time.perf_counter()
+        with self.cond:
+            share.request = frame
+            share.granted = False
+        while True:
+            with self.cond:
+                now = time.time()
+                self.dispatch(now)
+                if share.granted or share.request is None or global_vars.KILL_THREADS:
+                    frame, share.request = share.request, None
+                    if not share.granted:
+                        return None
+                    break
+                if self.running < self.slots and now < share.last_start + share.interval:
+                    self.cond.wait(share.last_start + share.interval - now)
+                else:
+                    self.cond.wait(SCHEDULER_WAIT)
+            newer = newer_frame()
+            if newer is not None:
+                with self.cond:
+                    if share.request is not None:
+                        share.superseded += 1
+                        share.metrics.inc('frames_superseded')
+                    share.request = newer
+        share.metrics.observe('schedule', time.perf_counter() - started)
+        return frame
+
+    def done(self, share, seconds):
+        # seconds is None when the turn failed before the model ran
+        with self.cond:
+            self.running -= 1
+            share.granted = False
+            if seconds is not None:
+                # A plain mean over the first few turns, so one slow inference doesn't stand for the stream
+                share.cost_samples += 1
+                share.cost += max(1.0 / share.cost_samples, COST_SMOOTHING) * (seconds - share.cost)
+            self.cond.notify_all()
+            now = time.time()
+            if now - self.last_report >= SCHEDULER_REPORT_INTERVAL:
+                self.report(now)
+
+    def dispatch(self, now):
+        # Called with the lock held
+        for share in self.shares.values():
+            if share.request is None or share.granted:
+                continue
+            if is_stale(frame_age(share.request.capture_ts, now)):
+                share.request = None
+                share.missed += 1
+                share.metrics.inc('frames_deadline_missed')
+                self.cond.notify_all()
+
+        while self.running < self.slots:
+            ready = [share for share in self.shares.values()
+                     if share.request is not None and not share.granted and now >= share.last_start + share.interval]
+            if not ready:
+                return
+            share = min(ready, key=lambda s: (max(s.virtual_time, self.virtual_time), s.request.capture_ts))
+            start = max(share.virtual_time, self.virtual_time)
+            self.virtual_time = start
+            share.virtual_time = start + max(share.cost, MIN_INFERENCE_COST) / share.weight
+            share.granted = True
+            share.last_start = now
+            share.scheduled += 1
+            share.metrics.inc('frames_scheduled')
+            self.running += 1
+            self.cond.notify_all()
+
+    def report(self, now):
+        elapsed = now - self.last_report
+        parts = []
+        for share in self.shares.values():
+            target = f"/{1 / share.interval:.0f}" if share.interval else ""
+            parts.append(f"{share.stream} {share.scheduled / elapsed:.1f}{target} fps "
+                         f"({share.missed} missed, {share.superseded} superseded)")
+            share.scheduled = share.missed = share.superseded = 0
+        self.last_report = now
+        if parts:
+            print(f"{DEBUG_PREFIX}Scheduler ({self.running}/{self.slots} busy): " + ", ".join(parts))
+
+shared_scheduler = None
+shared_scheduler_lock = threading.Lock()
+
+def get_inference_scheduler():
+    global shared_scheduler
+    with shared_scheduler_lock:
+        if shared_scheduler is None:
+            shared_scheduler = InferenceScheduler()
+        return shared_scheduler
+
+def jpeg_size(data):
+    # Reads (width, height) from the JPEG start-of-frame marker without decoding, or None
+    length = len(data)
+    if length < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    pos = 2
+    while pos + 9 <= length:
+        if data[pos] != 0xFF:
             return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1  # Fill byte
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = (data[pos + 5] << 8) | data[pos + 6]
+            width = (data[pos + 7] << 8) | data[pos + 8]
+            return width, height
+        pos += 2 + ((data[pos + 2] << 8) | data[pos + 3])
+    return None
+
+def decode_jpeg(payload, metrics=None):
+    # Let libjpeg downscale while decoding when the source is 2x/4x/8x the processing size,
+    # which skips most of the resize cost
+    np_arr = np.frombuffer(payload, np.uint8)
+    flag = cv2.IMREAD_COLOR
+    size = jpeg_size(payload)
+    if size is not None:
+        scale = min(size[0] // PROCESS_WIDTH, size[1] // PROCESS_HEIGHT)
+        if scale >= 8:
+            flag = cv2.IMREAD_REDUCED_COLOR_8
+        elif scale >= 4:
+            flag = cv2.IMREAD_REDUCED_COLOR_4
+        elif scale >= 2:
+            flag = cv2.IMREAD_REDUCED_COLOR_2
+    start = time.perf_counter()
+    frame = cv2.imdecode(np_arr, flag)
+    decoded = time.perf_counter()
+    if frame is not None and (frame.shape[1] != PROCESS_WIDTH or frame.shape[0] != PROCESS_HEIGHT):
+        # Resize for processing
+        frame = cv2.resize(frame, (PROCESS_WIDTH, PROCESS_HEIGHT), interpolation=cv2.INTER_LINEAR)
+    if metrics is not None:
+        metrics.observe('decode', decoded - start)
+        metrics.observe('resize', time.perf_counter() - decoded)
+    return frame
+
+def landmarks_to_array(landmark_list, with_visibility=False):
+    # The only per-landmark Python loop left: MediaPipe hands back protobufs
+    if with_visibility:
+        return np.array([(l.x, l.y, l.z, l.visibility) for l in landmark_list.landmark], np.float32)
+    return np.array([(l.x, l.y, l.z) for l in landmark_list.landmark], np.float32)
 
 class LandmarkSmoother:
-    def __init__(self, smoothing_factor=SMOOTHING_FACTOR):
+    # Smooths (33, 3) landmark arrays, or (N, 33, 3) batches of N streams at once.
+    # "ema" keeps the previous value for tiny movements and blends the rest with a fixed factor,
+    # "one_euro" adapts the cutoff to the landmark speed so fast moves lag less.
+    # The returned array is the smoother's own state; copy it to keep it past the next call.
+    def __init__(self, smoothing_factor=SMOOTHING_FACTOR, mode=SMOOTHING_MODE,
+                 min_cutoff=ONE_EURO_MIN_CUTOFF, beta=ONE_EURO_BETA, d_cutoff=ONE_EURO_D_CUTOFF):
+        if mode not in ("ema", "one_euro"):
+            raise ValueError(f"Unknown smoothing mode: {mode}")
         self.smoothing_factor = smoothing_factor
-        self.previous_landmarks = None
-        self.stable_landmarks = None
         self.movement_threshold = MIN_MOVEMENT_THRESHOLD
+        self.mode = mode
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
 
-    def smooth(self, landmarks):
-        if landmarks is None:
+    def reset(self):
+        self.stable_landmarks = None
+        self.last_time = None
+
+    def smooth(self, points, timestamp=None, valid=None):
+        # valid: optional (N,) bool mask for batches, streams without a new result keep their state
+        if points is None:
             return self.stable_landmarks
 
-        current_landmarks = []
-        for landmark in landmarks.landmark:
-            current_landmarks.append([landmark.x, landmark.y, landmark.z])
-
-        if self.previous_landmarks is None:
-            self.previous_landmarks = current_landmarks
-            self.stable_landmarks = current_landmarks
-            return landmarks
-
-        # Apply smoothing
-        smoothed_landmarks = []
-        for i, (curr, prev) in enumerate(zip(current_landmarks, self.previous_landmarks)):
-            smoothed = []
-            for j in range(3):  # x, y, z
-                # Calculate movement
-                movement = abs(curr[j] - prev[j])
-                
-                # Apply smoothing only if movement is significant
-                if movement > self.movement_threshold:
-                    smoothed_value = prev[j] * self.smoothing_factor + curr[j] * (1 - self.smoothing_factor)
-                else:
-                    smoothed_value = prev[j]  # Keep previous value for small movements
-                    
-                smoothed.append(smoothed_value)
-            smoothed_landmarks.append(smoothed)
+        if self.stable_landmarks is None or self.stable_landmarks.shape != points.shape:
+            self.stable_landmarks = np.array(points, np.float32)
+            self.delta = np.zeros_like(self.stable_landmarks)
+            self.mask = np.zeros(points.shape, bool)
+            self.velocity = np.zeros_like(self.stable_landmarks)
+            self.alpha = np.zeros_like(self.stable_landmarks)
+            self.last_time = timestamp
+            return self.stable_landmarks
+
+        np.subtract(points, self.stable_landmarks, out=self.delta)
+        if valid is not None:
+            self.delta[~valid] = 0.0
+        if self.mode == "ema":
+            self._smooth_ema()
+        else:
+            self._smooth_one_euro(timestamp)
+        np.add(self.stable_landmarks, self.delta, out=self.stable_landmarks, where=self.mask)
+        return self.stable_landmarks
+
+    def _smooth_ema(self):
+        # Apply smoothing only if movement is significant, keep previous value for small movements
+        delta, mask = self.delta, self.mask
+        np.greater(np.abs(delta), self.movement_threshold, out=mask)
+        delta *= 1 - self.smoothing_factor
+
+    def _smooth_one_euro(self, timestamp):
+        if timestamp is None or self.last_time is None or timestamp <= self.last_time:
+            dt = 1.0 / 30
+        else:
+            dt = timestamp - self.last_time
+        self.last_time = timestamp
+
+        delta, velocity, alpha = self.delta, self.velocity, self.alpha
+
+        # Low-pass the speed, then pick a per-coordinate cutoff from it
+        d_alpha = 1.0 / (1.0 + 1.0 / (2 * np.pi * self.d_cutoff * dt))
+        velocity += d_alpha * (delta / dt - velocity)
+        np.abs(velocity, out=alpha)
+        alpha *= self.beta
+        alpha += self.min_cutoff
+        # alpha = 1 / (1 + tau / dt) with tau = 1 / (2 * pi * cutoff)
+        alpha *= 2 * np.pi * dt
+        np.divide(alpha, alpha + 1.0, out=alpha)
+
+        delta *= alpha
+        self.mask.fill(True)
+
+class MotionGate:
+    # Decides whether a frame is worth a full pose inference, from the mean absolute difference of a
+    # tiny grayscale thumbnail against the last frame that was inferred. Comparing against the last
+    # inferred frame rather than the previous one means slow drift still adds up and triggers.
+    def __init__(self, threshold=None, max_skip=None):
+        self.threshold = global_vars.MOTION_GATE_THRESHOLD if threshold is None else threshold
+        self.max_skip = global_vars.MOTION_GATE_MAX_SKIP if max_skip is None else max_skip
+        self.reference = None
+        self.skipped = 0
+        self.score = 0.0
+
+    def reset(self):
+        self.reference = None
+        self.skipped = 0
+
+    def should_infer(self, image):
+        thumbnail = cv2.resize(image, (MOTION_GATE_WIDTH, MOTION_GATE_HEIGHT), interpolation=cv2.INTER_AREA)
+        thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        if self.reference is not None and self.skipped < self.max_skip:
+            self.score = cv2.mean(cv2.absdiff(thumbnail, self.reference))[0]
+            if self.score <= self.threshold:
+                self.skipped += 1
+                return False
+        self.reference = thumbnail
+        self.skipped = 0
+        return True
+
+def create_pose():
+    import mediapipe as mp
+
+    # Optimized pose settings
+    return mp.solutions.pose.Pose(
+        min_detection_confidence=0.6,  # Lowered for better performance
+        min_tracking_confidence=0.5,
+        model_complexity=0,  # Fastest model
+        static_image_mode=False,
+        enable_segmentation=False,
+        smooth_landmarks=True  # Enable MediaPipe's built-in smoothing
+    )
+
+def warm_up(pose):
+    # The first process() call initializes the graph; pay that on a blank frame instead of a real one
+    pose.process(np.zeros((PROCESS_HEIGHT, PROCESS_WIDTH, 3), np.uint8))
+    return pose
+
+class PoseModelPool:
+    # Keeps a few warmed-up Pose models ready so a stream's first frame doesn't wait for graph
+    # construction. Models are built on background threads, several at once, and each one taken
+    # is replaced; parked streams close theirs rather than return it, since it holds their tracking state.
+    def __init__(self, factory=create_pose, spares=None, build_threads=None):
+        self.factory = factory
+        self.target = global_vars.POSE_PREWARM if spares is None else spares
+        self.build_slots = threading.Semaphore(global_vars.POSE_BUILD_THREADS if build_threads is None else build_threads)
+        self.spares = deque()
+        self.building = 0
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.warmed = 0
+
+    def fill(self):
+        with self.lock:
+            missing = self.target - len(self.spares) - self.building
+            self.building += max(0, missing)
+        for _ in range(missing):
+            threading.Thread(target=self.build, daemon=True).start()
+
+    def build(self):
+        with self.build_slots:
+            started = time.time()
+            try:
+                pose = warm_up(self.factory())
+            except Exception as e:
+                print(f"{DEBUG_PREFIX}Pose model warm-up failed, no longer pre-warming: {e}")
+                pose = None
+        with self.lock:
+            self.building -= 1
+            if pose is None:
+                self.target = 0
+                return
+            self.spares.append(pose)
+            self.warmed += 1
+            ready = len(self.spares)
+        print(f"{DEBUG_PREFIX}Pose model warmed in {time.time() - started:.2f}s "
+              f"({ready} ready, {time.time() - self.started:.2f}s since startup)")
+
+    def acquire(self):
+        # A warm model if one is ready, otherwise one built on the spot
+        with self.lock:
+            pose = self.spares.popleft() if self.spares else None
+        self.fill()
+        return pose if pose is not None else self.factory()
+
+    def close(self):
+        with self.lock:
+            spares, self.spares = list(self.spares), deque()
+        for pose in spares:
+            pose.close()
+
+shared_model_pool = None
+shared_model_lock = threading.Lock()
+
+def get_model_pool():
+    # Shared by every body thread using the default create_pose() factory
+    global shared_model_pool
+    with shared_model_lock:
+        if shared_model_pool is None:
+            shared_model_pool = PoseModelPool()
+        return shared_model_pool
+
+class LandmarkOutput:
+    # One avatar's landmarks out: smoothing and encoder state, the ClientUDP to its port and, with a
+    # fixed output rate, the track the shared OutputScheduler samples instead of sending straight out.
+    # A BodyThread has one; multi_pose gives each further tracked person another. Results, gated
+    # frames and scheduler ticks may publish from different threads, so publishing is serialized.
+    def __init__(self, stream_id, output_port, metrics):
+        self.stream_id = stream_id  # Sent in binary packets, the input port
+        self.output_port = output_port
+        self.metrics = metrics
+        self.client = ClientUDP(global_vars.HOST, output_port, metrics=metrics)
+        self.smoother = LandmarkSmoother()
+        self.quantizer = QuantizedLandmarkEncoder(global_vars.QUANT_RESOLUTION, MIN_MOVEMENT_THRESHOLD,
+                                                  global_vars.KEYFRAME_INTERVAL)
+        self.output_frame_id = 0
+        self.last_points = None  # Last smoothed landmarks, re-sent for frames the motion gate skips
+        self.output_track = LandmarkTrack() if global_vars.OUTPUT_RATE_HZ else None
+        self.lock = threading.RLock()
+
+    def start(self):
+        self.client.start()
+        if self.output_track is not None:
+            get_output_scheduler().add(self)
+
+    def stop(self):
+        self.client.stop()
+        if self.output_track is not None:
+            get_output_scheduler().remove(self)
+
+    def reset(self):
+        with self.lock:
+            self.smoother.reset()
+            self.quantizer.reset()
+            self.last_points = None
+            if self.output_track is not None:
+                self.output_track.reset()
+
+    def publish(self, points, frame):
+        with self.lock:
+            self.last_points = points
+            if self.output_track is not None:
+                self.output_track.push(points, time.time(), frame.capture_ts)
+            else:
+                self.send_landmarks(points, frame.frame_id, frame.capture_ts)
+
+    def republish(self, frame):
+        # The last landmarks again, for a frame the motion gate skipped
+        with self.lock:
+            if self.last_points is not None:
+                self.publish(self.last_points, frame)
+
+    def send_landmarks(self, points, frame_id=None, capture_ts=0.0):
+        # points: 33 rows of x, y, z and optionally visibility
+        with self.lock:
+            self.encode_and_send(points, frame_id, capture_ts)
 
-        self.previous_landmarks = smoothed_landmarks
-        self.stable_landmarks = smoothed_landmarks
+    def encode_and_send(self, points, frame_id, capture_ts):
+        if frame_id is None:
+            frame_id = self.output_frame_id
+        self.output_frame_id += 1
+        start = time.perf_counter()
+        if global_vars.OUTPUT_FORMAT == "binary":
+            payload = encode_binary(points, self.stream_id, frame_id, capture_ts, global_vars.OUTPUT_VISIBILITY)
+        elif global_vars.OUTPUT_FORMAT == "quantized":
+            payload = self.quantizer.encode(points, self.stream_id, frame_id, capture_ts)
+        else:
+            payload = encode_text(points)
+        serialized = time.perf_counter()
+        self.metrics.observe('serialize', serialized - start)
 
-        # Create new landmark list with smoothed values
-        smoothed_result = type(landmarks)()
-        for i, smoothed_point in enumerate(smoothed_landmarks):
-            landmark = smoothed_result.landmark.add()
-            landmark.x = smoothed_point[0]
-            landmark.y = smoothed_point[1]
-            landmark.z = smoothed_point[2]
+        if payload is None:
+            return
+        if isinstance(payload, str):
+            self.send_data(payload)
+        else:
+            self.send_bytes(payload)
+        self.metrics.observe('send', time.perf_counter() - serialized)
+        self.metrics.observe_age('sent', frame_age(capture_ts, time.time()))
+
+    def send_bytes(self, payload):
+        try:
+            self.client.sendBytes(payload)
+        except Exception as e:
+            print(f"{DEBUG_PREFIX}Send error on port {self.output_port}: {e}")
 
-        return smoothed_result
+    def send_data(self, message):
+        try:
+            self.client.sendMessage(message)
+        except Exception as e:
+            print(f"{DEBUG_PREFIX}Send error on port {self.output_port}: {e}")
 
 class BodyThread(threading.Thread):
-    def __init__(self, input_port, output_port):
+    def __init__(self, input_port, output_port, receiver=None, pose_factory=None):
         super().__init__()
         self.input_port = input_port
         self.output_port = output_port
-        self.receiver = UDPFrameReceiver(self.input_port)
-        self.client = ClientUDP(global_vars.HOST, self.output_port)
-        self.smoother = LandmarkSmoother()
+        # Anything returning an object with MediaPipe's process() and close(), e.g. a benchmark stub.
+        # The model is only built once the stream's first frame arrives, and released when it parks.
+        self.pose_factory = pose_factory or create_pose
+        self.pose = None
+        self.stopped = False
+        self.share = None  # Standing with the shared InferenceScheduler while running
+        # A receiver passed in is driven by a shared IngestLoop rather than its own thread
+        self.owns_receiver = receiver is None
+        self.receiver = receiver or UDPFrameReceiver(self.input_port)
+        self.metrics = stream_metrics(self.input_port)
+        self.output = LandmarkOutput(self.input_port, self.output_port, self.metrics)
+        self.motion_gate = MotionGate() if global_vars.MOTION_GATE else None
+        self.state = STREAM_ACTIVE
+        self.last_frame_time = time.time()
         
         # Performance monitoring
         self.frame_count = 0
@@ -181,76 +1103,161 @@ class BodyThread(threading.Thread):
         print(f"{DEBUG_PREFIX}Body thread started: {input_port} -> {output_port}")
 
     def run(self):
-        mp_pose = mp.solutions.pose
-        self.receiver.start()
-        self.client.start()
+        if self.owns_receiver:
+            self.receiver.start()
+        self.output.start()
+
+        scheduler = None
+        if global_vars.FAIR_SCHEDULING:
+            scheduler = get_inference_scheduler()
+            self.share = scheduler.register(self.input_port)
 
-        # Optimized pose settings
-        with mp_pose.Pose(
-            min_detection_confidence=0.6,  # Lowered for better performance
-            min_tracking_confidence=0.5,
-            model_complexity=0,  # Fastest model
-            static_image_mode=False,
-            enable_segmentation=False,
-            smooth_landmarks=True  # Enable MediaPipe's built-in smoothing
-        ) as pose:
-            print(f"{DEBUG_PREFIX}Pose model started on port {self.input_port}")
-
-            consecutive_failures = 0
-            max_failures = 100  # Exit after too many failures
-
-            while not global_vars.KILL_THREADS and consecutive_failures < max_failures:
-                frame = self.receiver.get_frame()
+        while not global_vars.KILL_THREADS and not self.stopped:
+            frame = self.next_frame()
+            if frame is None or self.skip_static(frame):
+                continue
+            if scheduler is not None:
+                frame = scheduler.wait_turn(self.share, frame, self.newer_frame)
                 if frame is None:
-                    time.sleep(0.001)  # Very short sleep
-                    consecutive_failures += 1
                     continue
 
-                consecutive_failures = 0  # Reset failure counter
-                start_time = time.time()
-
-                try:
-                    # Process frame
-                    image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    image.flags.writeable = False  # Improve performance
-                    results = pose.process(image)
-
-                    if results.pose_world_landmarks:
-                        # Apply custom smoothing
-                        smoothed_landmarks = self.smoother.smooth(results.pose_world_landmarks)
-                        
-                        if smoothed_landmarks:
-                            # Build data string more efficiently
-                            data_parts = []
-                            for i in range(33):  # 33 pose landmarks
-                                landmark = smoothed_landmarks.landmark[i]
-                                data_parts.append(f"{i}|{landmark.x:.6f}|{landmark.y:.6f}|{landmark.z:.6f}")
-                            
-                            data_string = "\n".join(data_parts) + "\n"
-                            self.send_data(data_string)
-
-                except Exception as e:
-                    print(f"{DEBUG_PREFIX}Processing error on port {self.input_port}: {e}")
-                    consecutive_failures += 1
-
-                # Performance monitoring
-                process_time = time.time() - start_time
-                self.processing_times.append(process_time)
-                self.frame_count += 1
-
-                # Print stats less frequently
-                if time.time() - self.last_stats_time >= 3:  # Every 3 seconds
-                    avg_time = sum(self.processing_times) / len(self.processing_times) if self.processing_times else 0
-                    fps = self.frame_count / 3
-                    print(f"{DEBUG_PREFIX}Port {self.input_port}: {fps:.1f} FPS, avg process: {avg_time*1000:.1f}ms")
-                    self.frame_count = 0
-                    self.last_stats_time = time.time()
+            start_time = time.time()
+            inference_time = None
+
+            try:
+                pose = self.load_model()
+
+                # Process frame
+                stage_start = inference_start = time.perf_counter()
+                image = cv2.cvtColor(frame.image, cv2.COLOR_BGR2RGB)
+                image.flags.writeable = False  # Improve performance
+                stage_start = self.observe_stage('cvtcolor', stage_start)
+                results = pose.process(image)
+                stage_start = self.observe_stage('inference', stage_start)
+                # The scheduler's cost estimate leaves out building the model on the first frame
+                inference_time = stage_start - inference_start
+
+                if results.pose_world_landmarks:
+                    # Apply custom smoothing
+                    points = landmarks_to_array(results.pose_world_landmarks, with_visibility=True)
+                    points[:, :3] = self.output.smoother.smooth(points[:, :3], start_time)
+                    self.observe_stage('smoothing', stage_start)
+                    self.output.publish(points, frame)
+
+            except Exception as e:
+                print(f"{DEBUG_PREFIX}Processing error on port {self.input_port}: {e}")
+            finally:
+                if scheduler is not None:
+                    scheduler.done(self.share, inference_time)
 
+            self.record_stats(time.time() - start_time)
+
+        if scheduler is not None:
+            scheduler.unregister(self.share)
+        self.shutdown()
+
+    def stop(self):
+        # Ends the thread after at most FRAME_WAIT_TIMEOUT; used when a stream is removed at runtime
+        self.stopped = True
+
+    def shutdown(self):
+        self.release_model()
+        self.output.stop()
+        if self.owns_receiver:
+            self.receiver.stop()
         self.receiver.isRunning = False
         print(f"{DEBUG_PREFIX}Body thread stopped: {self.input_port}")
 
-    def send_data(self, message):
-        try:
-            self.client.sendMessage(message)
-        except Exception as e:
-            print(f"{DEBUG_PREFIX}Send error on port {self.output_port}: {e}")
\ No newline at end of file
+    def model_loaded(self):
+        return self.pose is not None
+
+    def load_model(self):
+        if self.pose is None:
+            started = time.time()
+            if self.pose_factory is create_pose:
+                self.pose = get_model_pool().acquire()
+            else:
+                self.pose = self.pose_factory()
+            print(f"{DEBUG_PREFIX}Pose model started on port {self.input_port} in {time.time() - started:.2f}s")
+        return self.pose
+
+    def release_model(self):
+        if self.pose is not None:
+            self.pose.close()
+            self.pose = None
+            print(f"{DEBUG_PREFIX}Pose model released on port {self.input_port}")
+
+    def next_frame(self):
+        # Blocks until the receiver has a frame; a stream that goes quiet is marked idle instead of stopped
+        frame = self.receiver.get_decoded(FRAME_WAIT_TIMEOUT)
+        now = time.time()
+        if frame is None:
+            if self.state == STREAM_ACTIVE and now - self.last_frame_time >= IDLE_TIMEOUT:
+                self.state = STREAM_IDLE
+                print(f"{DEBUG_PREFIX}Port {self.input_port}: idle")
+            elif (self.state == STREAM_IDLE and global_vars.STREAM_PARK_TIMEOUT
+                  and now - self.last_frame_time >= global_vars.STREAM_PARK_TIMEOUT):
+                self.state = STREAM_PARKED
+                print(f"{DEBUG_PREFIX}Port {self.input_port}: parked")
+                self.release_model()
+            return None
+        return self.accept_frame(frame, now)
+
+    def accept_frame(self, frame, now):
+        # Checks every received frame goes through before it may run inference
+        if self.state != STREAM_ACTIVE:
+            print(f"{DEBUG_PREFIX}Port {self.input_port}: resumed after {now - self.last_frame_time:.1f}s")
+            self.on_resume()
+        self.state = STREAM_ACTIVE
+        self.last_frame_time = now
+
+        # Past the deadline the landmarks would be too old to be worth the model time
+        age = frame_age(frame.capture_ts, now)
+        if is_stale(age):
+            self.metrics.inc('frames_stale')
+            return None
+        self.metrics.observe_age('inference', age)
+        return frame
+
+    def newer_frame(self):
+        # Polled while waiting for an inference turn, so the turn goes to the newest frame. It gets the
+        # same checks as a frame from next_frame(), motion gate included.
+        frame = self.receiver.get_decoded()
+        if frame is None:
+            return None
+        frame = self.accept_frame(frame, time.time())
+        if frame is None or self.skip_static(frame):
+            return None
+        return frame
+
+    def skip_static(self, frame):
+        # True when the motion gate judged the frame static; the last landmarks go out again instead
+        if self.motion_gate is None or self.motion_gate.should_infer(frame.image):
+            return False
+        self.metrics.inc('frames_gated')
+        self.output.republish(frame)
+        return True
+
+    def on_resume(self):
+        # State from before the gap would only drag the avatar back to an old pose
+        self.output.reset()
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+
+    def observe_stage(self, stage, start):
+        now = time.perf_counter()
+        self.metrics.observe(stage, now - start)
+        return now
+
+    def record_stats(self, process_time):
+        # Performance monitoring
+        self.processing_times.append(process_time)
+        self.frame_count += 1
+
+        # Print stats less frequently
+        if time.time() - self.last_stats_time >= 3:  # Every 3 seconds
+            avg_time = sum(self.processing_times) / len(self.processing_times) if self.processing_times else 0
+            fps = self.frame_count / 3
+            print(f"{DEBUG_PREFIX}Port {self.input_port}: {fps:.1f} FPS, avg process: {avg_time*1000:.1f}ms")
+            self.frame_count = 0
+            self.last_stats_time = time.time()
@@ -1,10 +1,367 @@
 import cv2
 import socket
+import threading
 import time
 import global_vars
+from shm_transport import SharedFrameWriter
+from frame_protocol import (KIND_CHUNK, MAX_CHUNK_PAYLOAD, pack_header, pack_ping, pack_shm_notify, unpack_feedback,
+                            ClockOffsetEstimator)
 
-# Maximum size per UDP packet (safe limit)
-MAX_UDP_PACKET_SIZE = 65000
+# Identifies this camera when several senders share one receiver port
+STREAM_ID = 0
+
+# How often to ping each receiver to keep the clock offset estimate fresh
+CLOCK_PING_INTERVAL = 1.0
+
+PACER_TOLERANCE = 0.5  # A frame up to half an interval early still counts, so camera jitter doesn't halve the rate
+SEND_BURST_BYTES = 256 * 1024  # Sent back to back before pacing kicks in, well under the receivers' 512 KB buffer
+STATS_INTERVAL = 5.0
+
+# Bitrate adaptation on receiver feedback
+ADAPT_INTERVAL = 1.0  # At most one adjustment per interval
+FEEDBACK_TIMEOUT = 5.0  # Receivers silent for longer (or too old to send feedback) are left out
+DROP_HIGH = 0.2  # Receiver throws away this share of frames undecoded or unprocessed: send fewer
+DROP_LOW = 0.05
+LOSS_HIGH = 0.05  # Frames lost in transit: send smaller ones
+LOSS_LOW = 0.01
+LATENCY_HIGH = 0.25  # Capture to landmarks out, in seconds
+FPS_HEADROOM = 1.2  # Sent above what the receiver processes, so it never waits for a frame
+FPS_STEP = 2
+QUALITY_DOWN_STEP = 10
+QUALITY_UP_STEP = 5
+
+SHM_FALLBACK_REPORTS = 3  # Feedback reports in a row of a receiver getting no shared frames before it gets UDP instead
+
+# Windows has no sendmsg, so header and payload are joined there
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+class ClockSync(threading.Thread):
+    # Pings every receiver from its own socket and blocks for the pongs, so the round trip is not
+    # inflated by the capture loop; the frame loop only reads the resulting offsets. The feedback
+    # receivers send after each pong goes to the listeners, e.g. the bitrate controller.
+    def __init__(self, targets, listeners=()):
+        super().__init__()
+        self.daemon = True
+        self.targets = targets
+        self.listeners = listeners
+        self.clocks = {target: ClockOffsetEstimator() for target in targets}
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.settimeout(CLOCK_PING_INTERVAL)
+
+    def to_server_time(self, target, local_ts):
+        # 0 (unknown) until a pong came back, so an unsynced clock can't make frames look stale
+        clock = self.clocks[target]
+        return clock.to_server_time(local_ts) if clock.synchronized() else 0.0
+
+    def run(self):
+        last_ping = 0.0
+        while not global_vars.KILL_THREADS:
+            now = time.time()
+            if now - last_ping >= CLOCK_PING_INTERVAL:
+                for target in self.targets:
+                    try:
+                        self.sock.sendto(pack_ping(time.time()), target)
+                    except OSError as e:
+                        # e.g. no route yet; try again on the next ping
+                        print(f"{global_vars.DEBUG_PREFIX}Ping to {target} failed: {e}")
+                last_ping = now
+            try:
+                data, addr = self.sock.recvfrom(256)
+            except (socket.timeout, ConnectionResetError):
+                continue
+            clock = self.clocks.get(addr)
+            if clock is None or clock.handle_pong(data, time.time()):
+                continue
+            feedback = unpack_feedback(data)
+            if feedback is not None:
+                for listener in self.listeners:
+                    listener.update(addr, feedback, time.time())
+        self.sock.close()
+
+class LatestSlot:
+    # Hands the newest item from one pipeline stage to the next; an item not yet taken is replaced
+    def __init__(self):
+        self.item = None
+        self.replaced = 0
+        self.ready = threading.Condition(threading.Lock())
+
+    def put(self, item):
+        with self.ready:
+            if self.item is not None:
+                self.replaced += 1
+            self.item = item
+            self.ready.notify()
+
+    def take(self, timeout=0.5):
+        with self.ready:
+            if self.item is None and not self.ready.wait_for(lambda: self.item is not None, timeout):
+                return None
+            item, self.item = self.item, None
+        return item
+
+class FramePacer:
+    # Fixed-rate schedule: a tick is due once its time comes, and a late tick doesn't make the next
+    # one early by more than a frame, so pacing recovers from stalls without bursting
+    def __init__(self, fps):
+        self.interval = 1.0 / fps if fps else 0.0
+        self.next_time = time.time()
+
+    def set_fps(self, fps):
+        self.interval = 1.0 / fps if fps else 0.0
+
+    def due(self, now):
+        if now + self.interval * PACER_TOLERANCE < self.next_time:
+            return False
+        self.next_time += self.interval
+        if self.next_time < now:
+            self.next_time = now + self.interval
+        return True
+
+class SendPacer:
+    # Token bucket on bytes sent, so bursts of 65 KB datagrams don't overflow receiver buffers
+    def __init__(self, bytes_per_second, burst):
+        self.rate = bytes_per_second
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.perf_counter()
+
+    def wait(self, size):
+        if not self.rate:
+            return
+        now = time.perf_counter()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < size:
+            time.sleep((size - self.tokens) / self.rate)
+            self.last = time.perf_counter()
+            self.tokens = size
+        self.tokens -= size
+
+class CaptureStage(threading.Thread):
+    # Grabs every camera frame so the driver never buffers stale ones, but only decodes those the pacer wants
+    def __init__(self, cap, outputs, fps):
+        super().__init__()
+        self.daemon = True
+        self.cap = cap
+        self.outputs = outputs
+        self.pacer = FramePacer(fps)
+        self.captured = 0
+
+    def run(self):
+        frame_id = 0
+        while not global_vars.KILL_THREADS:
+            if not self.cap.grab():
+                print(f"{global_vars.DEBUG_PREFIX}Failed to capture frame")
+                time.sleep(0.01)
+                continue
+            capture_ts = time.time()
+            if not self.pacer.due(capture_ts):
+                continue
+            ret, frame = self.cap.retrieve()
+            if not ret:
+                continue
+            for output in self.outputs:
+                output.put((frame_id, frame, capture_ts))
+            self.captured += 1
+            frame_id += 1
+
+class EncodeStage(threading.Thread):
+    # cv2.imencode releases the GIL, so encoding overlaps capture and sending
+    def __init__(self, input, output, quality):
+        super().__init__()
+        self.daemon = True
+        self.input = input
+        self.output = output
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.size = None  # (width, height) the receivers process at; larger frames are shrunk before encoding
+        self.encoded = 0
+
+    def set_quality(self, quality):
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+    def run(self):
+        while not global_vars.KILL_THREADS:
+            item = self.input.take()
+            if item is None:
+                continue
+            frame_id, frame, capture_ts = item
+            size = self.size
+            if size is not None and frame.shape[1] > size[0] and frame.shape[0] > size[1]:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            ok, jpeg = cv2.imencode('.jpg', frame, self.params)
+            if not ok:
+                continue
+            self.output.put((frame_id, jpeg, capture_ts))
+            self.encoded += 1
+
+class SendStage(threading.Thread):
+    # Sends each frame to every target. Chunk payloads are sliced once and shared by all targets;
+    # only the header differs per target (capture time in that receiver's clock). Targets are
+    # interleaved chunk by chunk so no receiver gets a whole frame as one burst.
+    def __init__(self, input, sock, targets, clock_sync):
+        super().__init__()
+        self.daemon = True
+        self.input = input
+        self.sock = sock
+        self.targets = targets
+        self.clock_sync = clock_sync
+        self.pacer = SendPacer(global_vars.SEND_MAX_MBPS * 125000, SEND_BURST_BYTES)
+        self.sent = 0
+        self.send_errors = 0
+
+    def run(self):
+        while not global_vars.KILL_THREADS:
+            item = self.input.take()
+            if item is None:
+                continue
+            self.send_frame(*item)
+
+    def send_frame(self, frame_id, jpeg, capture_ts):
+        data = memoryview(jpeg).cast('B')
+        frame_size = len(data)
+        chunk_count = max(1, (frame_size + MAX_CHUNK_PAYLOAD - 1) // MAX_CHUNK_PAYLOAD)
+        targets = self.targets  # Replaced, not mutated, when a shared memory target falls back to UDP
+        server_ts = [self.clock_sync.to_server_time(target, capture_ts) for target in targets]
+        for index in range(chunk_count):
+            offset = index * MAX_CHUNK_PAYLOAD
+            payload = data[offset:offset + MAX_CHUNK_PAYLOAD]
+            for target, ts in zip(targets, server_ts):
+                header = pack_header(KIND_CHUNK, STREAM_ID, index, chunk_count, frame_id, frame_size, offset, ts)
+                self.pacer.wait(len(header) + len(payload))
+                try:
+                    if HAS_SENDMSG:
+                        self.sock.sendmsg([header, payload], [], 0, target)
+                    else:
+                        self.sock.sendto(header + payload, target)
+                except OSError:
+                    self.send_errors += 1
+        self.sent += 1
+
+class SharedFrameStage(threading.Thread):
+    # Same-host targets: the raw frame goes into the target's shared memory ring, already at the pose
+    # input size, and only a small notification datagram is sent. No JPEG, chunking or clock sync.
+    # A target whose receiver reports no frames (it can't open the ring) is handed to fallback(),
+    # which sends it JPEG over UDP instead.
+    def __init__(self, input, sock, targets, fallback):
+        super().__init__()
+        self.daemon = True
+        self.input = input
+        self.sock = sock
+        self.targets = list(targets)
+        self.fallback = fallback
+        self.writers = []
+        self.silent_reports = {}  # target -> feedback reports in a row with no frames received
+        self.failed = set()  # Targets to hand over on this thread, which owns the writers
+        self.shared = 0  # Frames shared since start
+        self.sent = 0
+        self.send_errors = 0
+
+    def run(self):
+        from body import PROCESS_WIDTH, PROCESS_HEIGHT
+        self.writers = [SharedFrameWriter(port, STREAM_ID, PROCESS_WIDTH, PROCESS_HEIGHT) for _, port in self.targets]
+        try:
+            while not global_vars.KILL_THREADS:
+                item = self.input.take()
+                if self.failed:
+                    self.drop_failed()
+                if item is None:
+                    continue
+                self.send_frame(*item)
+        finally:
+            for writer in self.writers:
+                writer.close()
+
+    def update(self, target, feedback, now):
+        # Called on the ClockSync thread
+        if target not in self.targets or target in self.failed:
+            return
+        if feedback.received_fps > 0 or not self.shared:
+            self.silent_reports[target] = 0
+            return
+        self.silent_reports[target] = self.silent_reports.get(target, 0) + 1
+        if self.silent_reports[target] >= SHM_FALLBACK_REPORTS:
+            self.failed.add(target)
+
+    def drop_failed(self):
+        failed, self.failed = self.failed, set()
+        for target in failed:
+            index = self.targets.index(target)
+            del self.targets[index]
+            self.writers.pop(index).close()
+            print(f"{global_vars.DEBUG_PREFIX}{target} gets no shared memory frames, sending it JPEG over UDP")
+            self.fallback(target)
+
+    def send_frame(self, frame_id, frame, capture_ts):
+        notify = pack_shm_notify(STREAM_ID, frame_id, capture_ts)
+        for target, writer in zip(self.targets, self.writers):
+            writer.write(frame, frame_id, capture_ts)
+            try:
+                self.sock.sendto(notify, target)
+            except OSError:
+                self.send_errors += 1
+        self.shared += 1
+        self.sent += 1
+
+class BitrateController:
+    # One encoded stream goes to every target, so it follows the receiver worst off. Frame rate
+    # tracks what receivers process; quality backs off on loss or latency and creeps back up.
+    def __init__(self, capture, encode, max_fps):
+        self.capture = capture
+        self.encode = encode
+        self.max_fps = max_fps
+        self.fps = max_fps
+        self.quality = global_vars.JPEG_QUALITY
+        self.feedback = {}  # target -> (time received, StreamFeedback)
+        self.last_adjust = 0.0
+
+    def update(self, target, feedback, now):
+        self.feedback[target] = (now, feedback)
+        if now - self.last_adjust < ADAPT_INTERVAL:
+            return
+        self.last_adjust = now
+        fresh = [feedback for received, feedback in self.feedback.values() if now - received < FEEDBACK_TIMEOUT]
+        if not fresh:
+            return
+        drop_rate = max(feedback.drop_rate for feedback in fresh)
+        loss_rate = max(feedback.loss_rate for feedback in fresh)
+        latency = max(feedback.latency for feedback in fresh)
+        processed_fps = min(feedback.processed_fps for feedback in fresh)
+
+        fps = self.fps
+        if drop_rate > DROP_HIGH and processed_fps > 0:
+            fps = min(fps, processed_fps * FPS_HEADROOM)
+        elif drop_rate < DROP_LOW:
+            fps += FPS_STEP
+        fps = max(global_vars.MIN_SEND_FPS, min(self.max_fps, fps))
+
+        quality = self.quality
+        if loss_rate > LOSS_HIGH or latency > LATENCY_HIGH:
+            quality -= QUALITY_DOWN_STEP
+        elif loss_rate < LOSS_LOW:
+            quality += QUALITY_UP_STEP
+        quality = max(global_vars.MIN_JPEG_QUALITY, min(global_vars.JPEG_QUALITY, quality))
+
+        # No point sending more pixels than the largest receiver processes
+        self.encode.size = max((feedback.width, feedback.height) for feedback in fresh)
+        if round(fps) != round(self.fps) or quality != self.quality:
+            print(f"{global_vars.DEBUG_PREFIX}Adapting to receivers: {fps:.0f} fps, quality {quality} "
+                  f"(drop {drop_rate * 100:.0f}%, loss {loss_rate * 100:.1f}%, latency {latency * 1000:.0f} ms, "
+                  f"processed {processed_fps:.1f} fps)")
+        if round(fps) != round(self.fps):
+            self.capture.pacer.set_fps(fps)
+        if quality != self.quality:
+            self.encode.set_quality(quality)
+        self.fps = fps
+        self.quality = quality
+
+def is_local(host):
+    # An address this machine can bind to is one of its own
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+            probe.bind((socket.gethostbyname(host), 0))
+    except OSError:
+        return False
+    return True
 
 # UDP sender for camera frames
 def send_camera_frames():
@@ -16,39 +373,70 @@ def send_camera_frames():
     print(f"{global_vars.DEBUG_PREFIX}Camera opened at {cap.get(cv2.CAP_PROP_FPS)} fps")
 
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1024 * 1024)
     targets = [
                ("192.168.255.160", 52700),
                ]  # Example IP address of your friend
+    # Pongs and feedback come back from the resolved address, which is what every per-target table is keyed by
+    targets = [(socket.gethostbyname(host), port) for host, port in targets]
 
-    print(f"{global_vars.DEBUG_PREFIX}UDP sender targeting {targets}")
-
-    try:
-        while not global_vars.KILL_THREADS:
-            ret, frame = cap.read()
-            if not ret:
-                print(f"{global_vars.DEBUG_PREFIX}Failed to capture frame")
-                continue
+    local_targets = [target for target in targets if global_vars.SHM_TRANSPORT and is_local(target[0])]
+    targets = [target for target in targets if target not in local_targets]
+    print(f"{global_vars.DEBUG_PREFIX}UDP sender targeting {targets}, shared memory targets {local_targets}")
 
-            _, jpeg = cv2.imencode('.jpg', frame)
-            data = jpeg.tobytes()
+    # Capture, encode and send run concurrently; each hands over only its newest frame
+    captured = LatestSlot()
+    encoded = LatestSlot()
+    shared = LatestSlot()
+    capture = CaptureStage(cap, [], global_vars.SEND_FPS)
+    encode = EncodeStage(captured, encoded, global_vars.JPEG_QUALITY)
 
-            for target in targets:
-                sock.sendto(b'FRAME_START', target)
+    listeners = []
+    if global_vars.ADAPTIVE_BITRATE:
+        listeners.append(BitrateController(capture, encode, global_vars.SEND_FPS or cap.get(cv2.CAP_PROP_FPS) or 30))
 
-            # Send data in chunks to all targets
-            for i in range(0, len(data), MAX_UDP_PACKET_SIZE):
-                chunk = data[i:i + MAX_UDP_PACKET_SIZE]
-                for target in targets:
-                    sock.sendto(chunk, target)
+    # Capture timestamps are sent in each receiver's clock so it can measure frame age. Same-host
+    # targets are pinged too, for their feedback.
+    clock_sync = ClockSync(targets + local_targets, listeners)
 
-            for target in targets:
-                sock.sendto(b'FRAME_END', target)
+    def fall_back(target):
+        send.targets = send.targets + [target]
+        capture.outputs = [captured] + ([shared] if share.targets else [])
 
-            print(f"{global_vars.DEBUG_PREFIX}Sent frame to all targets in {len(data) // MAX_UDP_PACKET_SIZE + 1} chunks (total {len(data)} bytes)")
+    send = SendStage(encoded, sock, targets, clock_sync)
+    share = SharedFrameStage(shared, sock, local_targets, fall_back)
+    listeners.append(share)
+    if targets:
+        capture.outputs.append(captured)
+    if local_targets:
+        capture.outputs.append(shared)
+    # Encode and send wait idle while every target is local, until one falls back to UDP
+    stages = [capture, encode, send, share]
+    clock_sync.start()
+    for stage in stages:
+        stage.start()
 
-            time.sleep(0.01)  # Adjust as needed
+    try:
+        last_report = time.time()
+        while not global_vars.KILL_THREADS:
+            time.sleep(STATS_INTERVAL)
+            now = time.time()
+            elapsed = now - last_report
+            print(f"{global_vars.DEBUG_PREFIX}Captured {capture.captured / elapsed:.1f} fps, "
+                  f"encoded {encode.encoded / elapsed:.1f} fps, sent {send.sent / elapsed:.1f} fps "
+                  f"to {len(send.targets)} targets, shared {share.sent / elapsed:.1f} fps with {len(share.targets)} "
+                  f"(dropped {captured.replaced} before encode, {encoded.replaced} before send, "
+                  f"{shared.replaced} before sharing, {send.send_errors + share.send_errors} send errors)")
+            capture.captured = encode.encoded = send.sent = send.send_errors = share.sent = share.send_errors = 0
+            captured.replaced = encoded.replaced = shared.replaced = 0
+            last_report = now
+    except KeyboardInterrupt:
+        pass
 
     finally:
+        global_vars.KILL_THREADS = True
+        for stage in stages:
+            stage.join(timeout=1.0)
         cap.release()
         sock.close()
         print(f"{global_vars.DEBUG_PREFIX}Camera sender stopped")
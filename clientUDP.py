@@ -1,53 +1,196 @@
 import socket
 import time
 import threading
+from collections import deque
 
-class ClientUDP(threading.Thread):
+import global_vars
 
-    def run(self):
-        self.connect()
+RECONNECT_MIN_DELAY = 0.5
+RECONNECT_MAX_DELAY = 10.0
+SENDER_IDLE_TIMEOUT = 0.1  # Wakeup interval with nothing to send, for due reconnects
+SENDER_RETRY_DELAY = 0.001  # Wait after a full socket buffer before trying again
 
-    def __init__(self,ip,port, autoReconnect = True) -> None:
-        threading.Thread.__init__(self)
+class ClientUDP:
+    # Sending never blocks the caller: packets go into a small per-destination queue that keeps
+    # the newest ones, and the shared UDPSender thread writes them out and reconnects in the background
+
+    def __init__(self,ip,port, autoReconnect = True, metrics = None) -> None:
         self.ip = ip
         self.port = port
         self.autoReconnect = autoReconnect
+        self.metrics = metrics
         self.connected = False
+        self.socket = None
+        self.queue = deque(maxlen=global_vars.SEND_QUEUE_SIZE)
+        self.retryDelay = RECONNECT_MIN_DELAY
+        self.retryAt = 0.0
+        self.sender = None
+        self.removed = False
         pass
 
+    def start(self):
+        self.sender = get_udp_sender()
+        self.sender.add(self)
+
+    def stop(self):
+        # The sender thread may be inside flush(); it closes the socket once it is done with us
+        self.removed = True
+        if self.sender is not None:
+            self.sender.remove(self)
+        else:
+            self.close()
+
     def isConnected(self):
         return self.connected
 
     def sendMessage(self,message):
-        try:
-            message = str('%s<EOM>'%message).encode('utf-8')
-            self.socket.send(message)
-        except ConnectionRefusedError as ex:
-            print("Connection refused. Is server running?")
-            self.disconnect()
-        except ConnectionResetError as ex:
-            print("Server was disconnected...")
-            self.disconnect()
+        self.sendBytes(str('%s<EOM>'%message).encode('utf-8'))
 
-    def disconnect(self):
+    def sendBytes(self,payload):
+        # Binary packets are already framed by the datagram, no <EOM> terminator
+        if len(self.queue) == self.queue.maxlen:
+            self.count('send_dropped')
+        self.queue.append(payload)
+        if self.sender is not None:
+            self.sender.wake()
+
+    def count(self, event):
+        if self.metrics is not None:
+            self.metrics.inc(event)
+
+    def close(self):
         self.connected = False
-        self.socket.close()
-        if(self.autoReconnect):
-            time.sleep(1)
-            self.connect()
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def disconnect(self):
+        # Called on the sender thread; the next attempt is scheduled instead of slept for
+        self.close()
+        self.count('send_errors')
+        if self.autoReconnect:
+            self.retryAt = time.time() + self.retryDelay
+            self.retryDelay = min(self.retryDelay * 2, RECONNECT_MAX_DELAY)
+        else:
+            self.retryAt = float('inf')
 
     def connect(self):
         try:
-            self.socket = socket.socket(socket.AF_INET, 
-                                        socket.SOCK_DGRAM)     
+            self.socket = socket.socket(socket.AF_INET,
+                                        socket.SOCK_DGRAM)
+            self.socket.setblocking(False)
             print("Attempting Connection...")
             self.socket.connect((self.ip, self.port))
             print("Will send messages to "+str(self.socket.getpeername()))
             self.connected = True
-        except ConnectionRefusedError as ex:
-            print("Connection refused. Is server running?")
+            self.retryDelay = RECONNECT_MIN_DELAY
+        except OSError as ex:
+            print(f"Connection to {self.ip}:{self.port} failed ({ex}), retrying in {self.retryDelay:.1f}s")
             self.disconnect()
-        except ConnectionResetError as ex:
-            print("Server was disconnected...")
-            self.disconnect()
-        
\ No newline at end of file
+
+    def flush(self, now):
+        # Writes out everything queued, returns False once the socket would block
+        if self.removed:
+            return True
+        if not self.connected:
+            if now < self.retryAt:
+                return True
+            self.connect()
+            if not self.connected:
+                return True
+        while self.queue:
+            payload = self.queue.popleft()
+            try:
+                self.socket.send(payload)
+            except BlockingIOError:
+                self.queue.appendleft(payload)
+                return False
+            except ConnectionRefusedError:
+                # Nothing listening yet (ICMP port unreachable from an earlier packet)
+                print(f"Connection refused by {self.ip}:{self.port}. Is server running?")
+                self.disconnect()
+                return True
+            except OSError as ex:
+                print(f"Send to {self.ip}:{self.port} failed: {ex}")
+                self.disconnect()
+                return True
+        return True
+
+
+class UDPSender(threading.Thread):
+    # One thread sending for every ClientUDP. Each wakeup writes out all queued packets grouped
+    # by host, so several streams' packets for the same Unity instance go out in one burst.
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.hosts = {}
+        self.lock = threading.Lock()
+        self.pending = threading.Event()
+        self.removed = []  # Stopped clients whose sockets are closed on this thread
+
+    def add(self, client):
+        with self.lock:
+            # Replaced rather than mutated so the sender thread can iterate without the lock
+            hosts = dict(self.hosts)
+            hosts[client.ip] = hosts.get(client.ip, []) + [client]
+            self.hosts = hosts
+        self.wake()
+
+    def remove(self, client):
+        with self.lock:
+            clients = [c for c in self.hosts.get(client.ip, []) if c is not client]
+            hosts = dict(self.hosts)
+            if clients:
+                hosts[client.ip] = clients
+            else:
+                hosts.pop(client.ip, None)
+            self.hosts = hosts
+            self.removed.append(client)
+        self.wake()
+
+    def wake(self):
+        self.pending.set()
+
+    def run(self):
+        while not global_vars.KILL_THREADS:
+            self.pending.wait(SENDER_IDLE_TIMEOUT)
+            self.pending.clear()
+            now = time.time()
+            blocked = False
+            for clients in self.hosts.values():
+                for client in clients:
+                    try:
+                        if not client.flush(now):
+                            blocked = True
+                    except Exception as ex:
+                        # One broken client must not stop landmark output for every other stream
+                        print(f"Sender error for {client.ip}:{client.port}: {ex}")
+                        client.disconnect()
+            self.close_removed()
+            if blocked:
+                time.sleep(SENDER_RETRY_DELAY)
+                self.pending.set()
+
+        self.close_removed()
+        for clients in self.hosts.values():
+            for client in clients:
+                client.close()
+
+    def close_removed(self):
+        with self.lock:
+            removed, self.removed = self.removed, []
+        for client in removed:
+            client.close()
+
+
+_udp_sender = None
+_udp_sender_lock = threading.Lock()
+
+
+def get_udp_sender():
+    global _udp_sender
+    with _udp_sender_lock:
+        if _udp_sender is None:
+            _udp_sender = UDPSender()
+            _udp_sender.start()
+        return _udp_sender
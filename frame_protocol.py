@@ -0,0 +1,161 @@
+# Chunked frame protocol shared by camera_sender and UDPFrameReceiver
+import struct
+
+PROTOCOL_MAGIC = b'AV'
+PROTOCOL_VERSION = 1
+
+# Datagram kinds
+KIND_CHUNK = 0
+KIND_PING = 1  # Sender -> receiver, capture_ts holds the sender's send time
+KIND_PONG = 2  # Receiver -> sender, echoes the ping time, payload is the receiver's clock
+KIND_SHM_FRAME = 3  # Same-host sender -> receiver, frame_id is waiting in the shared memory ring (shm_transport.py)
+KIND_FEEDBACK = 4  # Receiver -> sender after each pong, payload is how the stream is keeping up
+
+# magic, version, kind, stream id, chunk index, chunk count, frame id,
+# frame size, chunk offset, capture timestamp (seconds since epoch)
+HEADER = struct.Struct('!2sBBHHHIIId')
+HEADER_SIZE = HEADER.size
+
+# Maximum size per UDP packet (safe limit), header included
+MAX_UDP_PACKET_SIZE = 65000
+MAX_CHUNK_PAYLOAD = MAX_UDP_PACKET_SIZE - HEADER_SIZE
+
+# Frame ids are 32-bit and wrap around
+FRAME_ID_MODULO = 1 << 32
+
+PONG_PAYLOAD = struct.Struct('!d')
+# frames received/s, frames processed/s, drop rate, loss rate, capture-to-output latency (s),
+# size the receiver processes frames at
+FEEDBACK_PAYLOAD = struct.Struct('!fffffHH')
+CLOCK_SAMPLES = 16  # Ping results kept for the clock offset estimate
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+class ChunkHeader:
+    __slots__ = ('kind', 'stream_id', 'chunk_index', 'chunk_count',
+                 'frame_id', 'frame_size', 'offset', 'capture_ts')
+
+    def __init__(self, kind, stream_id, chunk_index, chunk_count, frame_id, frame_size, offset, capture_ts):
+        self.kind = kind
+        self.stream_id = stream_id
+        self.chunk_index = chunk_index
+        self.chunk_count = chunk_count
+        self.frame_id = frame_id
+        self.frame_size = frame_size
+        self.offset = offset
+        self.capture_ts = capture_ts
+
+
+class StreamFeedback:
+    __slots__ = ('received_fps', 'processed_fps', 'drop_rate', 'loss_rate', 'latency', 'width', 'height')
+
+    def __init__(self, received_fps, processed_fps, drop_rate, loss_rate, latency, width, height):
+        self.received_fps = received_fps
+        self.processed_fps = processed_fps
+        self.drop_rate = drop_rate
+        self.loss_rate = loss_rate
+        self.latency = latency
+        self.width = width
+        self.height = height
+
+
+def pack_header(kind, stream_id, chunk_index, chunk_count, frame_id, frame_size, offset, capture_ts):
+    return HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, kind, stream_id, chunk_index,
+                       chunk_count, frame_id % FRAME_ID_MODULO, frame_size, offset, capture_ts)
+
+
+def unpack_header(data):
+    """Parse the header at the start of a datagram, raising ProtocolError if it is not ours"""
+    if len(data) < HEADER_SIZE:
+        raise ProtocolError(f"datagram too short ({len(data)} bytes)")
+    magic, version, kind, stream_id, chunk_index, chunk_count, frame_id, frame_size, offset, capture_ts = \
+        HEADER.unpack_from(data)
+    if magic != PROTOCOL_MAGIC:
+        raise ProtocolError("bad magic")
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"unsupported protocol version {version}")
+    if kind == KIND_CHUNK:
+        if chunk_count == 0 or chunk_index >= chunk_count:
+            raise ProtocolError(f"bad chunk index {chunk_index}/{chunk_count}")
+        if offset + len(data) - HEADER_SIZE > frame_size:
+            raise ProtocolError("chunk overruns frame")
+    return ChunkHeader(kind, stream_id, chunk_index, chunk_count, frame_id, frame_size, offset, capture_ts)
+
+
+def frame_chunks(stream_id, frame_id, data, capture_ts, chunk_size=MAX_CHUNK_PAYLOAD):
+    """Split an encoded frame into self-describing datagrams"""
+    frame_size = len(data)
+    chunk_count = max(1, (frame_size + chunk_size - 1) // chunk_size)
+    view = memoryview(data)
+    for index in range(chunk_count):
+        offset = index * chunk_size
+        header = pack_header(KIND_CHUNK, stream_id, index, chunk_count, frame_id, frame_size, offset, capture_ts)
+        yield header + view[offset:offset + chunk_size]
+
+
+def frame_id_newer(a, b):
+    """True if frame id a comes after b, allowing for wrap-around"""
+    return 0 < (a - b) % FRAME_ID_MODULO < FRAME_ID_MODULO // 2
+
+
+def pack_shm_notify(stream_id, frame_id, capture_ts):
+    return pack_header(KIND_SHM_FRAME, stream_id, 0, 0, frame_id, 0, 0, capture_ts)
+
+
+def pack_ping(sent_ts):
+    return pack_header(KIND_PING, 0, 0, 0, 0, 0, 0, sent_ts)
+
+
+def pack_pong(ping_header, server_ts):
+    return pack_header(KIND_PONG, ping_header.stream_id, 0, 0, 0, PONG_PAYLOAD.size, 0,
+                       ping_header.capture_ts) + PONG_PAYLOAD.pack(server_ts)
+
+
+def pack_feedback(stream_id, feedback):
+    return pack_header(KIND_FEEDBACK, stream_id, 0, 0, 0, FEEDBACK_PAYLOAD.size, 0, 0.0) + FEEDBACK_PAYLOAD.pack(
+        feedback.received_fps, feedback.processed_fps, feedback.drop_rate, feedback.loss_rate,
+        feedback.latency, feedback.width, feedback.height)
+
+
+def unpack_feedback(data):
+    """The StreamFeedback in a feedback datagram, or None if data is something else"""
+    try:
+        header = unpack_header(data)
+    except ProtocolError:
+        return None
+    if header.kind != KIND_FEEDBACK or len(data) < HEADER_SIZE + FEEDBACK_PAYLOAD.size:
+        return None
+    return StreamFeedback(*FEEDBACK_PAYLOAD.unpack_from(data, HEADER_SIZE))
+
+
+class ClockOffsetEstimator:
+    # NTP-style offset from ping/pong round trips. The sample with the shortest round trip among
+    # the last few wins, since it has the least queuing delay skewing it.
+    def __init__(self):
+        self.samples = []
+        self.offset = 0.0
+        self.rtt = None
+
+    def synchronized(self):
+        return self.rtt is not None
+
+    def handle_pong(self, data, now):
+        # Returns True if data was a pong
+        try:
+            header = unpack_header(data)
+        except ProtocolError:
+            return False
+        if header.kind != KIND_PONG or len(data) < HEADER_SIZE + PONG_PAYLOAD.size:
+            return False
+        server_ts, = PONG_PAYLOAD.unpack_from(data, HEADER_SIZE)
+        rtt = now - header.capture_ts
+        self.samples.append((rtt, server_ts - (header.capture_ts + now) / 2))
+        del self.samples[:-CLOCK_SAMPLES]
+        self.rtt, self.offset = min(self.samples)
+        return True
+
+    def to_server_time(self, local_ts):
+        return local_ts + self.offset
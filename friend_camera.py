@@ -5,8 +5,29 @@ import websockets
 import asyncio
 import json
 import base64
+import struct
+import threading
 import time
 
+# Binary frame mesajı başlığı: magic, sürüm, bayraklar, frame numarası, yakalama zamanı (sunucu saati).
+# Sunucudaki ws_ingest.WS_FRAME_HEADER ile aynı olmalı
+FRAME_HEADER = struct.Struct('!2sBBId')
+FRAME_MAGIC = b'AF'
+FRAME_VERSION = 1
+
+TARGET_FPS = 30
+
+# Tıkanıklık kontrolü: WebSocket gönderim tamponu bu kadar byte'ı geçerse frame atlanır ve
+# önce JPEG kalitesi, sonra çözünürlük düşürülür; tampon boş kaldıkça yavaşça geri alınır
+SEND_HIGH_WATER = 256 * 1024
+MAX_QUALITY = 80
+MIN_QUALITY = 40
+QUALITY_STEP = 10
+MIN_SCALE = 0.5
+SCALE_STEP = 0.25
+ADAPT_INTERVAL = 0.5  # İki düşürme arasındaki en kısa süre (saniye)
+RECOVER_FRAMES = 60  # Bir kademe geri almak için art arda sorunsuz gönderilen frame sayısı
+
 
 class FriendCameraClient:
     def __init__(self, server_ip="192.168.1.100", username=None):
@@ -23,6 +44,23 @@ class FriendCameraClient:
             self.backend = cv2.CAP_V4L2
 
         self.cap = None
+        # Sunucu saati ile yerel saat arasındaki fark (saniye)
+        self.clock_offset = 0.0
+        self.clock_synced = False  # Senkronize olmadan zaman damgası 0 gönderilir (sunucu için "bilinmiyor")
+
+        # Yakalama thread'i ile event loop arasında sadece en yeni frame tutulur
+        self.latest = None
+        self.latest_lock = threading.Lock()
+        self.running = False
+        self.loop = None
+        self.frame_ready = None
+
+        # Tıkanıklığa göre ayarlanan encode ayarları
+        self.jpeg_quality = MAX_QUALITY
+        self.scale = 1.0
+        self.frames_dropped = 0
+        self.clear_frames = 0
+        self.last_degrade = 0.0
 
     def _find_camera(self):
         """Kamerayı bul ve aç"""
@@ -52,6 +90,26 @@ class FriendCameraClient:
 
         print(f"📹 Kamera ayarlandı: {w}×{h} @ {fps:.1f} FPS")
 
+    async def _sync_clock(self, ws, rounds=5):
+        """Sunucu ile saat farkını ölç (ping/pong), sunucu desteklemiyorsa fark 0 kalır"""
+        samples = []
+        for _ in range(rounds):
+            t0 = time.time()
+            await ws.send(json.dumps({"type": "clock_ping", "t0": t0}))
+            try:
+                reply = json.loads(await asyncio.wait_for(ws.recv(), timeout=1.0))
+            except (asyncio.TimeoutError, ValueError):
+                break
+            if reply.get("type") != "clock_pong" or reply.get("t0") != t0:
+                break
+            t3 = time.time()
+            samples.append((t3 - t0, reply["server_time"] - (t0 + t3) / 2))
+
+        if samples:
+            rtt, self.clock_offset = min(samples)
+            self.clock_synced = True
+            print(f"   🕒 Saat farkı: {self.clock_offset * 1000:+.1f} ms (RTT {rtt * 1000:.1f} ms)")
+
     async def connect_and_stream(self):
         """Sunucuya bağlan ve stream başlat"""
         if not self._find_camera():
@@ -85,52 +143,70 @@ class FriendCameraClient:
 
                 user_id = data.get("user_id", "unknown")
                 color = data.get("color", "#FF6B6B")
+                # Sunucu destekliyorsa frame'ler base64 JSON yerine binary gönderilir (~%33 daha küçük)
+                binary_frames = bool(data.get("binary_frames"))
 
                 print(f"✅ {self.username} başarıyla kaydedildi!")
                 print(f"   👤 Kullanıcı ID: {user_id}")
                 print(f"   🎨 Renk: {color}")
                 print(f"   📡 Sunucuya bağlandı, streaming başlıyor...")
 
+                await self._sync_clock(ws)
+
                 frame_count = 0
                 start_time = time.time()
                 last_info_time = time.time()
 
-                # Ana streaming döngüsü
-                while True:
-                    ret, frame = self.cap.read()
-                    if not ret:
-                        print("⚠️  Kameradan frame alınamadı")
-                        break
-
-                    # Kullanıcı bilgisini frame'e ekle
-                    self._add_user_info(frame, self.username, user_id, color)
-
-                    # Frame'i encode et
-                    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                    if not ok:
-                        continue
-
-                    # Sunucuya gönder
-                    payload = {
-                        "type": "frame",
-                        "frame": base64.b64encode(buffer).decode('ascii'),
-                        "timestamp": time.time(),
-                        "frame_number": frame_count
-                    }
-
-                    await ws.send(json.dumps(payload))
-                    frame_count += 1
-
-                    # Bilgi göster
-                    current_time = time.time()
-                    if current_time - last_info_time >= 5.0:
-                        elapsed = current_time - start_time
-                        avg_fps = frame_count / elapsed
-                        print(f"📈 {self.username}: {frame_count} frame gönderildi, ortalama {avg_fps:.1f} FPS")
-                        last_info_time = current_time
-
-                    # Frame rate kontrolü
-                    await asyncio.sleep(1 / 30)
+                # Yakalama ve encode ayrı bir thread'de; event loop sadece en yeni frame'i gönderir
+                self.loop = asyncio.get_running_loop()
+                self.frame_ready = asyncio.Event()
+                self.running = True
+                worker = threading.Thread(target=self._capture_loop, args=(user_id, color), daemon=True)
+                worker.start()
+
+                try:
+                    # Ana streaming döngüsü
+                    while self.running:
+                        await self.frame_ready.wait()
+                        self.frame_ready.clear()
+                        with self.latest_lock:
+                            latest, self.latest = self.latest, None
+                        if latest is None:
+                            continue
+                        buffer, capture_ts = latest
+
+                        # Gönderim tamponu dolmuşsa bu frame'i gönderme, eskiyecek frame'leri kuyruğa yığma
+                        if self._send_backlog(ws) > SEND_HIGH_WATER:
+                            self.frames_dropped += 1
+                            self._adapt(congested=True)
+                            continue
+
+                        # Sunucuya gönder
+                        if binary_frames:
+                            header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, 0, frame_count & 0xFFFFFFFF, capture_ts)
+                            await ws.send(header + buffer.tobytes())
+                        else:
+                            payload = {
+                                "type": "frame",
+                                "frame": base64.b64encode(buffer).decode('ascii'),
+                                "timestamp": capture_ts,
+                                "frame_number": frame_count
+                            }
+                            await ws.send(json.dumps(payload))
+                        frame_count += 1
+                        self._adapt(congested=False)
+
+                        # Bilgi göster
+                        current_time = time.time()
+                        if current_time - last_info_time >= 5.0:
+                            elapsed = current_time - start_time
+                            avg_fps = frame_count / elapsed
+                            print(f"📈 {self.username}: {frame_count} frame gönderildi, ortalama {avg_fps:.1f} FPS "
+                                  f"(kalite {self.jpeg_quality}, ölçek {self.scale:.2f}, {self.frames_dropped} frame atlandı)")
+                            last_info_time = current_time
+                finally:
+                    self.running = False
+                    worker.join(timeout=1.0)
 
         except websockets.exceptions.ConnectionClosed:
             print(f"🔌 {self.username}: Sunucu bağlantısı kesildi")
@@ -144,6 +220,80 @@ class FriendCameraClient:
                 self.cap.release()
                 print(f"📷 {self.username}: Kamera kapatıldı")
 
+    def _capture_loop(self, user_id, color):
+        """Kameradan oku, bilgi ekle ve encode et (worker thread); hedef FPS'e göre zamanlanır"""
+        interval = 1 / TARGET_FPS
+        next_deadline = time.time()
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                print("⚠️  Kameradan frame alınamadı")
+                break
+            # Yakalama zamanı, sunucu saatine çevrilmiş
+            now = time.time()
+            capture_ts = now + self.clock_offset if self.clock_synced else 0.0
+
+            # Kamera hedef FPS'ten hızlıysa sırası gelmeyen frame'ler atlanır; geç kalınırsa
+            # program kaydırılır, böylece birikmiş gecikme ani bir frame patlamasına dönüşmez
+            if now < next_deadline - interval / 2:
+                continue
+            next_deadline += interval
+            if next_deadline < now:
+                next_deadline = now + interval
+
+            # Kullanıcı bilgisini frame'e ekle
+            self._add_user_info(frame, self.username, user_id, color)
+
+            scale = self.scale
+            if scale < 1.0:
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+            # Frame'i encode et
+            ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if not ok:
+                continue
+
+            with self.latest_lock:
+                self.latest = (buffer, capture_ts)
+            self.loop.call_soon_threadsafe(self.frame_ready.set)
+
+        self.running = False
+        self.loop.call_soon_threadsafe(self.frame_ready.set)
+
+    def _send_backlog(self, ws):
+        """WebSocket'in henüz gönderemediği byte sayısı"""
+        transport = getattr(ws, "transport", None)
+        return transport.get_write_buffer_size() if transport is not None else 0
+
+    def _adapt(self, congested):
+        """Tıkanıklıkta kaliteyi/çözünürlüğü düşür, bağlantı rahatladıkça geri al"""
+        if congested:
+            self.clear_frames = 0
+            now = time.time()
+            if now - self.last_degrade < ADAPT_INTERVAL:
+                return
+            self.last_degrade = now
+            if self.jpeg_quality > MIN_QUALITY:
+                self.jpeg_quality = max(MIN_QUALITY, self.jpeg_quality - QUALITY_STEP)
+            elif self.scale > MIN_SCALE:
+                self.scale = max(MIN_SCALE, self.scale - SCALE_STEP)
+            else:
+                return
+            print(f"🐢 {self.username}: Bağlantı yavaş, kalite {self.jpeg_quality}, ölçek {self.scale:.2f}")
+            return
+
+        self.clear_frames += 1
+        if self.clear_frames < RECOVER_FRAMES:
+            return
+        self.clear_frames = 0
+        if self.scale < 1.0:
+            self.scale = min(1.0, self.scale + SCALE_STEP)
+        elif self.jpeg_quality < MAX_QUALITY:
+            self.jpeg_quality = min(MAX_QUALITY, self.jpeg_quality + QUALITY_STEP)
+        else:
+            return
+        print(f"🚀 {self.username}: Bağlantı rahatladı, kalite {self.jpeg_quality}, ölçek {self.scale:.2f}")
+
     def _add_user_info(self, frame, username, user_id, color):
         """Frame'e kullanıcı bilgisi ekle"""
         # Rengi BGR formatına çevir
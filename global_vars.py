@@ -19,14 +19,98 @@ FPS = 60
 WIDTH = 320
 HEIGHT = 240
 
+# camera_sender.py: frames sent per second (0 = every camera frame), JPEG quality [0, 100] and
+# outgoing bandwidth cap across all targets in Mbit/s (0 = unpaced)
+SEND_FPS = 30
+JPEG_QUALITY = 80
+SEND_MAX_MBPS = 200
+# Lower the frame rate, JPEG quality and frame size to what the receivers report getting through,
+# never below these floors
+ADAPTIVE_BITRATE = True
+MIN_SEND_FPS = 10
+MIN_JPEG_QUALITY = 40
+# Targets on this machine get raw frames through shared memory instead of JPEG over UDP (see shm_transport.py)
+SHM_TRANSPORT = True
+
 # [0, 2] Higher numbers are more precise, but also cost more performance. The demo video used 2 (good environment is more important).
 MODEL_COMPLEXITY = 0
 
-# List of input UDP ports for camera feeds
+# List of input UDP ports for camera feeds started at launch; more can be added at runtime
 INPUT_PORTS = [52700, 52701, 52702, 52703, 52704, 52705, 52706, 52707]
 
+# Local HTTP API for adding and removing camera ports while running, see stream_registry.py (0 disables)
+CONTROL_PORT = 9101
+
+# WebSocket server for friend_camera.py clients, see ws_ingest.py (0 disables, needs the websockets package).
+# Each connected camera is a stream numbered from WS_STREAM_BASE, sending to get_output_port(stream).
+WEBSOCKET_PORT = 52733
+WS_MAX_USERS = 16
+WS_STREAM_BASE = 52800
+
+# Seconds a stream may stay idle before its pose model is released (0 keeps it loaded); the
+# model is built again from the stream's next frame
+STREAM_PARK_TIMEOUT = 30.0
+
+# "selector": one thread receives every input port, "threaded": one receiver thread per port
+INGEST_MODE = "selector"
+
+# "thread": a MediaPipe Pose per BodyThread in this process, "process": a pool of worker processes
+INFERENCE_BACKEND = "thread"
+POSE_WORKERS = 4  # Worker processes for the "process" backend, independent of the number of streams
+MAX_STREAMS = 16  # Streams the "process" backend has shared memory for
+
+# "thread" backend: a central scheduler picks which stream runs inference next when the CPU is
+# saturated, sharing it by weight, capping each stream at its target fps and dropping frames that
+# pass STALE_FRAME_DEADLINE_MS while waiting for their turn
+FAIR_SCHEDULING = True
+INFERENCE_SLOTS = 0  # Inferences running at once, 0 = one per CPU core
+TARGET_FPS = 0  # Per stream, 0 = as fast as frames arrive
+STREAM_TARGET_FPS = {}  # Input port -> target fps, overrides TARGET_FPS
+STREAM_WEIGHTS = {}  # Input port -> share of inference time relative to others (default 1.0)
+
+# Pose model for the "thread" backend: "solutions" (MediaPipe Pose, one person per camera) or
+# "landmarker" (Tasks PoseLandmarker in live stream mode, up to MAX_PERSONS people per camera, see
+# multi_pose.py). Person k > 0 of a camera is sent to get_person_output_port(output_port, k).
+POSE_ENGINE = "solutions"
+POSE_LANDMARKER_MODEL = "pose_landmarker_lite.task"  # From https://developers.google.com/mediapipe/solutions/vision/pose_landmarker
+MAX_PERSONS = 2
+
+POSE_PREWARM = 4  # Warmed-up Pose models kept ready so a camera's first frame doesn't build one
+POSE_BUILD_THREADS = 4  # Models built at once in the background
+
+# Landmark packets sent to Unity: "text" ("i|x|y|z" lines + <EOM>), "binary" (float32) or
+# "quantized" (int16 deltas with periodic keyframes), see landmark_codec.py
+OUTPUT_FORMAT = "text"
+OUTPUT_VISIBILITY = False  # Binary format only: send 33x4 floats including visibility
+QUANT_RESOLUTION = 0.0001  # Quantized format: meters per int16 step (covers +-3.2 m)
+KEYFRAME_INTERVAL = 30  # Quantized format: send all joints every N packets
+
+# Send landmarks at a fixed rate per output port instead of whenever inference finishes (0 disables).
+# Between inference results the scheduler interpolates ("interpolate", renders one inference interval
+# behind) or extrapolates from the last two results ("extrapolate", no added delay).
+OUTPUT_RATE_HZ = 0
+OUTPUT_MODE = "interpolate"
+OUTPUT_EXTRAPOLATE_LIMIT = 0.1  # Seconds past the newest result before the pose is held
+OUTPUT_MAX_SPEED = 3.0  # Meters per second, per joint, when extrapolating
+OUTPUT_HOLD_TIME = 1.0  # Stop sending once a stream has had no result for this long
+
+# Landmark packets waiting per output port while Unity is unreachable or the socket is full; the oldest are dropped
+SEND_QUEUE_SIZE = 4
+
+# Frames older than this (capture to inference start) are dropped without running the model (0 disables)
+STALE_FRAME_DEADLINE_MS = 250
+
+# Skip pose inference on frames that barely changed, re-sending the last landmarks instead
+MOTION_GATE = False
+MOTION_GATE_THRESHOLD = 2.0  # Mean absolute difference (0-255) of a 32x24 grayscale thumbnail
+MOTION_GATE_MAX_SKIP = 10  # Force a full inference at least every N+1 frames
+
+# Local HTTP endpoint serving per-stage latency histograms in Prometheus text format (0 disables)
+METRICS_PORT = 9100
+
 # Function to get output port for a given input port
 get_output_port = lambda input_port: input_port + 33
+get_person_output_port = lambda output_port, person: output_port + person * 1000
 
 # Debug prefix for easy debug removal
 DEBUG_PREFIX = 'DEBUG_'
\ No newline at end of file
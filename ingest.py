@@ -0,0 +1,84 @@
+# Single-threaded UDP ingest for every camera port
+import selectors
+import threading
+import time
+import global_vars
+
+# Debug prefix for easy removal
+DEBUG_PREFIX = "DEBUG_"
+
+SELECT_TIMEOUT = 0.05  # Upper bound on how late incomplete frames get expired
+HOUSEKEEPING_INTERVAL = 0.05
+
+
+class IngestLoop(threading.Thread):
+    # Watches the sockets of many UDPFrameReceivers with one selector (epoll/kqueue where available)
+    # so the number of receive threads no longer grows with the number of cameras
+    def __init__(self, receivers=()):
+        super().__init__()
+        self.daemon = True
+        self.selector = selectors.DefaultSelector()
+        self.receivers = []
+        self.lock = threading.Lock()
+        self.removed = []  # Receivers to close on the loop thread, which may be reading them right now
+        self.last_housekeeping = time.time()
+        for receiver in receivers:
+            self.add(receiver)
+
+    def add(self, receiver):
+        # Safe to call while the loop is running
+        receiver.sock.setblocking(False)
+        with self.lock:
+            self.selector.register(receiver.sock, selectors.EVENT_READ, receiver)
+            self.receivers = self.receivers + [receiver]
+        receiver.isRunning = True
+
+    def remove(self, receiver):
+        # Returns once the socket is closed, so the port can be bound again straight away
+        closed = threading.Event()
+        with self.lock:
+            self.receivers = [r for r in self.receivers if r is not receiver]
+            self.removed.append((receiver, closed))
+        if not self.is_alive():
+            self.close_removed()
+        closed.wait(SELECT_TIMEOUT * 10)
+
+    def close_removed(self):
+        with self.lock:
+            removed, self.removed = self.removed, []
+        for receiver, closed in removed:
+            self.close_receiver(receiver)
+            closed.set()
+            print(f"{DEBUG_PREFIX}Ingest loop stopped watching port {receiver.port}")
+
+    def close_receiver(self, receiver):
+        receiver.isRunning = False
+        self.selector.unregister(receiver.sock)
+        receiver.sock.close()
+        receiver.close_shared_frames()
+
+    def run(self):
+        print(f"{DEBUG_PREFIX}Ingest loop watching ports {[r.port for r in self.receivers]}")
+
+        while not global_vars.KILL_THREADS:
+            if self.removed:
+                self.close_removed()
+            events = self.selector.select(timeout=SELECT_TIMEOUT)
+            now = time.time()
+            for key, _ in events:
+                receiver = key.data
+                try:
+                    receiver.drain(now)
+                except Exception as e:
+                    print(f"{DEBUG_PREFIX}UDP error on port {receiver.port}: {e}")
+
+            if now - self.last_housekeeping >= HOUSEKEEPING_INTERVAL:
+                for receiver in self.receivers:
+                    receiver.housekeeping(now)
+                self.last_housekeeping = now
+
+        self.close_removed()
+        for receiver in self.receivers:
+            self.close_receiver(receiver)
+        self.selector.close()
+        print(f"{DEBUG_PREFIX}Ingest loop stopped")
@@ -0,0 +1,161 @@
+# Landmark wire formats sent from BodyThread to Unity
+import struct
+
+import numpy as np
+
+LANDMARK_COUNT = 33
+
+# Binary format: header followed by 33 x 3 (or 33 x 4 with visibility) little-endian float32.
+# Little-endian throughout so Unity can read it with BitConverter on any desktop platform.
+BINARY_MAGIC = b'AL'
+BINARY_VERSION = 1
+# magic, version, flags, stream id, frame id, capture timestamp (seconds since epoch)
+BINARY_HEADER = struct.Struct('<2sBBHId')
+BINARY_HEADER_SIZE = BINARY_HEADER.size
+
+# Header flags
+FLAG_VISIBILITY = 0x01  # Each landmark carries a fourth float, its visibility
+FLAG_QUANTIZED = 0x02  # int16 x, y, z at a fixed resolution instead of float32
+FLAG_KEYFRAME = 0x04  # Quantized packet carries all 33 joints
+
+# Quantized format: the binary header, then resolution (meters per step) and the frame id of
+# the packet this one builds on, then either all 33 x 3 int16 (keyframe) or a 64-bit joint mask
+# followed by x, y, z int16 for the joints set in the mask (delta)
+QUANT_HEADER = struct.Struct('<fI')
+DELTA_MASK = struct.Struct('<Q')
+QUANT_LIMIT = 32767
+INT16_LE = np.dtype('<i2')
+JOINT_BITS = np.left_shift(np.uint64(1), np.arange(LANDMARK_COUNT, dtype=np.uint64))
+
+FLOAT32_LE = np.dtype('<f4')
+
+
+class LandmarkFrame:
+    __slots__ = ('stream_id', 'frame_id', 'capture_ts', 'flags', 'points')
+
+    def __init__(self, stream_id, frame_id, capture_ts, flags, points):
+        self.stream_id = stream_id
+        self.frame_id = frame_id
+        self.capture_ts = capture_ts
+        self.flags = flags
+        self.points = points
+
+
+def encode_text(points):
+    # Original "i|x|y|z" lines, kept for clients that parse text
+    data_parts = [f"{i}|{x:.6f}|{y:.6f}|{z:.6f}" for i, (x, y, z) in enumerate(points[:, :3].tolist())]
+    return "\n".join(data_parts) + "\n"
+
+
+def encode_binary(points, stream_id, frame_id, capture_ts, with_visibility=False):
+    # points: (33, 3) or (33, 4) array; visibility is only sent when asked for and available
+    flags = 0
+    if with_visibility and points.shape[1] >= 4:
+        flags |= FLAG_VISIBILITY
+        values = points[:, :4]
+    else:
+        values = points[:, :3]
+    header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, flags, stream_id & 0xFFFF,
+                                frame_id & 0xFFFFFFFF, capture_ts)
+    return header + values.astype(FLOAT32_LE, copy=False).tobytes()
+
+
+def decode_binary(data):
+    # Reference decoder, mirrors what the Unity side does
+    if len(data) < BINARY_HEADER_SIZE:
+        raise ValueError(f"landmark packet too short ({len(data)} bytes)")
+    magic, version, flags, stream_id, frame_id, capture_ts = BINARY_HEADER.unpack_from(data)
+    if magic != BINARY_MAGIC or version != BINARY_VERSION:
+        raise ValueError("not a binary landmark packet")
+    columns = 4 if flags & FLAG_VISIBILITY else 3
+    points = np.frombuffer(data, FLOAT32_LE, LANDMARK_COUNT * columns, BINARY_HEADER_SIZE)
+    return LandmarkFrame(stream_id, frame_id, capture_ts, flags, points.reshape(LANDMARK_COUNT, columns))
+
+
+def pack_joint_mask(moved):
+    return int(np.dot(moved.astype(np.uint64), JOINT_BITS))
+
+
+def unpack_joint_mask(mask):
+    return (mask & JOINT_BITS) != 0
+
+
+class QuantizedLandmarkEncoder:
+    # Quantizes landmarks to int16 steps of `resolution` meters and only sends joints that moved
+    # more than `threshold` since the state the decoder was last sent, with a full keyframe every
+    # `keyframe_interval` packets so a lost packet is recovered from. Decoded coordinates are
+    # within resolution / 2 of the input for sent joints (inputs beyond +-32767 steps are clamped),
+    # and unsent joints stay within threshold + resolution / 2.
+    def __init__(self, resolution, threshold, keyframe_interval):
+        self.resolution = resolution
+        self.threshold_steps = threshold / resolution
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.reset()
+
+    def reset(self):
+        self.state = None
+        self.last_frame_id = 0
+        self.since_keyframe = 0
+
+    def encode(self, points, stream_id, frame_id, capture_ts):
+        # Returns the packet, or None when no joint moved enough to be worth sending
+        quantized = np.rint(points[:, :3] / self.resolution)
+        np.clip(quantized, -QUANT_LIMIT, QUANT_LIMIT, out=quantized)
+        quantized = quantized.astype(INT16_LE)
+
+        self.since_keyframe += 1
+        if self.state is None or self.since_keyframe >= self.keyframe_interval:
+            flags = FLAG_QUANTIZED | FLAG_KEYFRAME
+            payload = quantized.tobytes()
+            self.state = quantized
+            self.since_keyframe = 0
+        else:
+            change = np.abs(quantized.astype(np.int32) - self.state).max(axis=1)
+            moved = change > self.threshold_steps
+            if not moved.any():
+                return None
+            flags = FLAG_QUANTIZED
+            payload = DELTA_MASK.pack(pack_joint_mask(moved)) + quantized[moved].tobytes()
+            self.state[moved] = quantized[moved]
+
+        header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, flags, stream_id & 0xFFFF,
+                                    frame_id & 0xFFFFFFFF, capture_ts)
+        reference = QUANT_HEADER.pack(self.resolution, self.last_frame_id & 0xFFFFFFFF)
+        self.last_frame_id = frame_id
+        return header + reference + payload
+
+
+class QuantizedLandmarkDecoder:
+    # Reference decoder for QuantizedLandmarkEncoder packets. `stale` is set when a delta does not
+    # build on the last packet seen (one was lost) and cleared by the next keyframe.
+    def __init__(self):
+        self.state = None
+        self.last_frame_id = None
+        self.stale = True
+
+    def decode(self, data):
+        # Returns a LandmarkFrame with float32 points, or None until the first keyframe arrives
+        if len(data) < BINARY_HEADER_SIZE + QUANT_HEADER.size:
+            raise ValueError(f"landmark packet too short ({len(data)} bytes)")
+        magic, version, flags, stream_id, frame_id, capture_ts = BINARY_HEADER.unpack_from(data)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION or not flags & FLAG_QUANTIZED:
+            raise ValueError("not a quantized landmark packet")
+        resolution, reference = QUANT_HEADER.unpack_from(data, BINARY_HEADER_SIZE)
+        offset = BINARY_HEADER_SIZE + QUANT_HEADER.size
+
+        if flags & FLAG_KEYFRAME:
+            self.state = np.frombuffer(data, INT16_LE, LANDMARK_COUNT * 3, offset).reshape(LANDMARK_COUNT, 3).copy()
+            self.stale = False
+        else:
+            if self.state is None:
+                return None
+            if reference != self.last_frame_id:
+                self.stale = True
+            moved = unpack_joint_mask(DELTA_MASK.unpack_from(data, offset)[0])
+            count = int(moved.sum())
+            values = np.frombuffer(data, INT16_LE, count * 3, offset + DELTA_MASK.size)
+            self.state[moved] = values.reshape(count, 3)
+        self.last_frame_id = frame_id
+
+        points = self.state.astype(np.float32) * np.float32(resolution)
+        return LandmarkFrame(stream_id, frame_id, capture_ts, flags, points)
@@ -1,25 +1,91 @@
 # UDP server for multiple camera feeds
-from body import BodyThread
 import time
+STARTED = time.perf_counter()
+from body import get_model_pool
+from ingest import IngestLoop
+from pose_pool import PoseProcessPool
+from metrics import start_metrics_server
+from stream_registry import StreamRegistry, start_control_server
 import global_vars
 from sys import exit
 
-# Input ports for camera feeds
-INPUT_PORTS = [52700, 52701, 52702, 52703, 52704, 52705, 52706, 52707]
-
-# Start a thread for each input port
-threads = []
-for input_port in INPUT_PORTS:
-    output_port = input_port + 33  # Map to output port
-    print(f"Starting thread for port {input_port} -> {output_port}")
-    thread = BodyThread(input_port, output_port)
-    thread.start()
-    threads.append(thread)
-
-try:
-    i = input()
-finally:
-    print("Exiting...")
-    global_vars.KILL_THREADS = True
-    time.sleep(0.5)
-    exit()
\ No newline at end of file
+
+class StartupTimer:
+    def __init__(self, started):
+        self.started = started
+        self.last = started
+        self.phases = []
+
+    def phase(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def report(self):
+        phases = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases)
+        print(f"Startup: {phases} (total {(self.last - self.started) * 1000:.0f}ms)")
+
+
+def main():
+    timer = StartupTimer(STARTED)
+    timer.phase("imports")
+
+    if global_vars.METRICS_PORT:
+        start_metrics_server(global_vars.METRICS_PORT)
+
+    # Receive every camera on one selector thread, or give each port its own receiver thread
+    ingest = None
+    if global_vars.INGEST_MODE == "selector":
+        ingest = IngestLoop()
+
+    # Run pose inference in worker processes, or in each BodyThread
+    pool = None
+    if global_vars.INFERENCE_BACKEND == "process":
+        pool = PoseProcessPool(global_vars.MAX_STREAMS, global_vars.POSE_WORKERS)
+        pool.start()
+        timer.phase("pose workers started")
+
+    if ingest is not None:
+        ingest.start()
+
+    # Start a thread for each configured input port; pose models load once a camera sends
+    registry = StreamRegistry(ingest, pool)
+    for input_port in global_vars.INPUT_PORTS:
+        output_port = global_vars.get_output_port(input_port)  # Map to output port
+        print(f"Starting thread for port {input_port} -> {output_port}")
+        try:
+            registry.add(input_port, output_port)
+        except Exception as e:
+            print(f"Could not start port {input_port}: {e}")
+    timer.phase("sockets bound")
+
+    if global_vars.CONTROL_PORT:
+        start_control_server(registry, global_vars.CONTROL_PORT)
+    if global_vars.WEBSOCKET_PORT:
+        try:
+            from ws_ingest import start_websocket_server
+        except ImportError as e:
+            print(f"WebSocket camera ingest disabled: {e}")
+        else:
+            start_websocket_server(global_vars.WEBSOCKET_PORT)
+    timer.phase("servers started")
+
+    # Frames are already being buffered; models are built and warmed in the background from here
+    if pool is None and global_vars.POSE_ENGINE == "solutions":
+        get_model_pool().fill()
+    timer.report()
+
+    try:
+        i = input()
+    finally:
+        print("Exiting...")
+        global_vars.KILL_THREADS = True
+        time.sleep(0.5)
+        if pool is not None:
+            pool.close()
+        exit()
+
+
+# Worker processes re-import this module when using the spawn start method
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# Per-stream, per-stage timing histograms and counters, served in Prometheus text format
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Debug prefix for easy removal
+DEBUG_PREFIX = "DEBUG_"
+
+# Pipeline stages timed for every stream
+STAGES = ('recv', 'reassembly', 'decode', 'resize', 'schedule', 'cvtcolor', 'inference', 'smoothing', 'serialize', 'send')
+
+# Points along the pipeline where the frame's age since capture is recorded
+AGE_POINTS = ('reassembled', 'decoded', 'inference', 'sent')
+
+# Upper bounds in seconds, 50 us to 1 s
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+# Capture-to-stage age, 5 ms to 2 s
+AGE_BUCKETS = (0.005, 0.01, 0.02, 0.033, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0, 2.0)
+
+
+class Histogram:
+    # Fixed buckets. Several threads can write one histogram (decode workers and the shared memory
+    # reader both time 'decode'), so writes take a lock; the exporter reads plain ints without it,
+    # so a scrape can at worst be one observation behind
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class StreamMetrics:
+    def __init__(self, stream):
+        self.stream = stream
+        self.stages = {stage: Histogram() for stage in STAGES}
+        self.ages = {point: Histogram(AGE_BUCKETS) for point in AGE_POINTS}
+        self.counters = {}
+        self.counter_lock = threading.Lock()  # e.g. frames_stale comes from decode workers and the body thread
+        self.stats = None  # StreamStats of the stream's receiver, exported as counters
+
+    def observe(self, stage, seconds):
+        self.stages[stage].observe(seconds)
+
+    def observe_age(self, point, age):
+        # age is None when the frame carried no trustworthy capture timestamp
+        if age is not None:
+            self.ages[point].observe(age)
+
+    def inc(self, name, amount=1):
+        with self.counter_lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.streams = {}
+        self.lock = threading.Lock()
+
+    def stream(self, stream):
+        metrics = self.streams.get(stream)
+        if metrics is None:
+            with self.lock:
+                metrics = self.streams.setdefault(stream, StreamMetrics(stream))
+        return metrics
+
+    def render(self):
+        lines = [
+            "# HELP avatar_stage_seconds Time spent in each pipeline stage",
+            "# TYPE avatar_stage_seconds histogram",
+        ]
+        streams = list(self.streams.values())
+        for metrics in streams:
+            for stage, histogram in metrics.stages.items():
+                render_histogram(lines, 'avatar_stage_seconds', f'stream="{metrics.stream}",stage="{stage}"', histogram)
+
+        lines.append("# HELP avatar_frame_age_seconds Time since capture when a frame reached each point")
+        lines.append("# TYPE avatar_frame_age_seconds histogram")
+        for metrics in streams:
+            for point, histogram in metrics.ages.items():
+                render_histogram(lines, 'avatar_frame_age_seconds', f'stream="{metrics.stream}",point="{point}"', histogram)
+
+        lines.append("# HELP avatar_events_total Frame and chunk outcomes per stream")
+        lines.append("# TYPE avatar_events_total counter")
+        for metrics in streams:
+            with metrics.counter_lock:
+                events = dict(metrics.counters)
+            if metrics.stats is not None:
+                events.update(vars(metrics.stats))
+            for name, value in sorted(events.items()):
+                lines.append(f'avatar_events_total{{stream="{metrics.stream}",event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+def render_histogram(lines, name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.9f}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+
+REGISTRY = MetricsRegistry()
+
+
+def stream_metrics(stream):
+    return REGISTRY.stream(stream)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"{DEBUG_PREFIX}Metrics available at http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,227 @@
+# Multi-person pose tracking with MediaPipe Tasks' PoseLandmarker in live stream mode
+#
+# Frames are handed to detect_async() and results arrive on MediaPipe's callback thread, so the
+# frame loop never waits for the model; frames submitted while the model is busy are skipped by
+# MediaPipe. Up to MAX_PERSONS people per camera keep stable ids across frames (PersonTracker),
+# and each holds one output channel: the first the stream's own output port, person slot k the
+# port get_person_output_port(output_port, k), each with its own smoother and encoder state.
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import global_vars
+from body import BodyThread, LandmarkOutput, DEBUG_PREFIX
+
+TORSO_LANDMARKS = (11, 12, 23, 24)  # Shoulders and hips, steadier than any single joint
+MATCH_DISTANCE = 0.2  # Largest torso move between results still counted as the same person, in image widths
+TRACK_TIMEOUT = 0.5  # Seconds a person may go undetected before their id and channel are given up
+
+
+def create_landmarker(num_poses, callback):
+    from mediapipe.tasks.python import BaseOptions, vision
+
+    options = vision.PoseLandmarkerOptions(
+        base_options=BaseOptions(model_asset_path=global_vars.POSE_LANDMARKER_MODEL),
+        running_mode=vision.RunningMode.LIVE_STREAM,
+        num_poses=num_poses,
+        min_pose_detection_confidence=0.6,
+        min_pose_presence_confidence=0.5,
+        min_tracking_confidence=0.5,
+        output_segmentation_masks=False,
+        result_callback=callback)
+    return vision.PoseLandmarker.create_from_options(options)
+
+
+def torso_center(landmarks):
+    return np.array([(landmarks[i].x, landmarks[i].y) for i in TORSO_LANDMARKS], np.float32).mean(axis=0)
+
+
+def world_points(landmarks):
+    return np.array([(l.x, l.y, l.z, l.visibility or 0.0) for l in landmarks], np.float32)
+
+
+class PersonTrack:
+    __slots__ = ('person_id', 'center', 'last_seen')
+
+    def __init__(self, person_id, center, last_seen):
+        self.person_id = person_id
+        self.center = center
+        self.last_seen = last_seen
+
+
+class PersonTracker:
+    # Matches each detection to the nearest track by torso center, closest pairs first. A person
+    # missing from a few results keeps their slot until TRACK_TIMEOUT, so a missed detection doesn't
+    # hand their avatar to someone else.
+    def __init__(self, slots, max_distance=MATCH_DISTANCE, timeout=TRACK_TIMEOUT):
+        self.slots = slots
+        self.max_distance = max_distance
+        self.timeout = timeout
+        self.tracks = {}  # slot -> PersonTrack
+        self.next_id = 0
+
+    def reset(self):
+        self.tracks = {}
+
+    def update(self, centers, now):
+        # Returns the slot of each detection (None when every slot is taken), the slots that got a
+        # new person and the slots whose person left
+        ended = [slot for slot, track in self.tracks.items() if now - track.last_seen > self.timeout]
+        for slot in ended:
+            del self.tracks[slot]
+
+        pairs = sorted((float(np.linalg.norm(center - track.center)), index, slot)
+                       for index, center in enumerate(centers) for slot, track in self.tracks.items())
+        assigned = [None] * len(centers)
+        matched = set()
+        for distance, index, slot in pairs:
+            if distance > self.max_distance:
+                break
+            if assigned[index] is None and slot not in matched:
+                assigned[index] = slot
+                matched.add(slot)
+
+        started = []
+        free = [slot for slot in range(self.slots) if slot not in self.tracks]
+        for index, center in enumerate(centers):
+            slot = assigned[index]
+            if slot is None:
+                if not free:
+                    continue
+                slot = assigned[index] = free.pop(0)
+                self.tracks[slot] = PersonTrack(self.next_id, center, now)
+                self.next_id += 1
+                started.append(slot)
+            else:
+                track = self.tracks[slot]
+                track.center = center
+                track.last_seen = now
+        return assigned, started, ended
+
+
+class MultiPoseBodyThread(BodyThread):
+    # self.pose holds the PoseLandmarker, so loading, parking and describe() work as for BodyThread.
+    # Inference runs on MediaPipe's own thread, outside the fair InferenceScheduler.
+    def __init__(self, input_port, output_port, receiver=None, max_persons=None):
+        super().__init__(input_port, output_port, receiver)
+        self.max_persons = max_persons or global_vars.MAX_PERSONS
+        self.channels = [self.output] + [LandmarkOutput(input_port, global_vars.get_person_output_port(output_port, slot),
+                                                        self.metrics)
+                                         for slot in range(1, self.max_persons)]
+        self.tracker = PersonTracker(self.max_persons)
+        self.result_lock = threading.Lock()  # Channels and tracker are shared with MediaPipe's callback thread
+        self.in_flight = {}  # Timestamp (ms) -> (frame, submit time) awaiting a result
+        self.clock_start = time.perf_counter()
+        self.last_timestamp = -1
+
+    def run(self):
+        if self.owns_receiver:
+            self.receiver.start()
+        for channel in self.channels:
+            channel.start()
+
+        while not global_vars.KILL_THREADS and not self.stopped:
+            frame = self.next_frame()
+            if frame is None or self.skip_static(frame):
+                continue
+            try:
+                self.submit(frame)
+            except Exception as e:
+                print(f"{DEBUG_PREFIX}Processing error on port {self.input_port}: {e}")
+
+        self.shutdown()
+
+    def shutdown(self):
+        super().shutdown()
+        for channel in self.channels[1:]:
+            channel.stop()
+
+    def load_model(self):
+        if self.pose is None:
+            started = time.time()
+            self.pose = create_landmarker(self.max_persons, self.handle_result)
+            print(f"{DEBUG_PREFIX}Pose landmarker started on port {self.input_port} in {time.time() - started:.2f}s "
+                  f"(up to {self.max_persons} people)")
+        return self.pose
+
+    def release_model(self):
+        super().release_model()
+        with self.result_lock:
+            self.in_flight.clear()
+
+    def submit(self, frame):
+        import mediapipe as mp
+
+        landmarker = self.load_model()
+        start = time.perf_counter()
+        image = cv2.cvtColor(frame.image, cv2.COLOR_BGR2RGB)
+        self.observe_stage('cvtcolor', start)
+        # Live stream timestamps must strictly increase
+        timestamp = max(int((start - self.clock_start) * 1000), self.last_timestamp + 1)
+        self.last_timestamp = timestamp
+        with self.result_lock:
+            self.in_flight[timestamp] = (frame, start)
+        landmarker.detect_async(mp.Image(image_format=mp.ImageFormat.SRGB, data=image), timestamp)
+
+    def handle_result(self, result, image, timestamp):
+        # Runs on MediaPipe's callback thread, in timestamp order
+        now = time.perf_counter()
+        with self.result_lock:
+            pending = self.in_flight.pop(timestamp, None)
+            # Frames submitted while the model was busy never get a result
+            skipped = [t for t in self.in_flight if t < timestamp]
+            for t in skipped:
+                del self.in_flight[t]
+            if skipped:
+                self.metrics.inc('frames_superseded', len(skipped))
+            if pending is None:
+                return
+            frame, submitted = pending
+            self.metrics.observe('inference', now - submitted)
+            try:
+                self.publish_people(result, frame)
+            except Exception as e:
+                print(f"{DEBUG_PREFIX}Processing error on port {self.input_port}: {e}")
+        self.record_stats(now - submitted)
+
+    def publish_people(self, result, frame):
+        start = time.perf_counter()
+        now = time.time()
+        centers = [torso_center(landmarks) for landmarks in result.pose_landmarks]
+        slots, started, ended = self.tracker.update(centers, now)
+        for slot in ended:
+            self.channels[slot].reset()
+            print(f"{DEBUG_PREFIX}Port {self.input_port}: person left output {self.channels[slot].output_port}")
+        for slot in started:
+            self.channels[slot].reset()
+            print(f"{DEBUG_PREFIX}Port {self.input_port}: person {self.tracker.tracks[slot].person_id} "
+                  f"-> output {self.channels[slot].output_port}")
+
+        for landmarks, slot in zip(result.pose_world_landmarks, slots):
+            if slot is None:
+                continue
+            channel = self.channels[slot]
+            points = world_points(landmarks)
+            points[:, :3] = channel.smoother.smooth(points[:, :3], now)
+            channel.publish(points, frame)
+        self.observe_stage('smoothing', start)
+
+    def skip_static(self, frame):
+        # Everyone's last landmarks go out again for a frame the motion gate skips
+        if self.motion_gate is None or self.motion_gate.should_infer(frame.image):
+            return False
+        self.metrics.inc('frames_gated')
+        with self.result_lock:
+            for channel in self.channels:
+                channel.republish(frame)
+        return True
+
+    def on_resume(self):
+        with self.result_lock:
+            self.tracker.reset()
+            for channel in self.channels:
+                channel.reset()
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
@@ -0,0 +1,138 @@
+# Fixed-rate landmark output, decoupled from inference timing
+import threading
+import time
+
+import numpy as np
+
+import global_vars
+
+# Debug prefix for easy removal
+DEBUG_PREFIX = "DEBUG_"
+
+INTERVAL_SMOOTHING = 0.2  # EMA weight of the newest gap when estimating the inference interval
+MAX_INTERP_DELAY = 0.1  # Cap on how far behind real time interpolation renders
+
+
+class LandmarkSample:
+    __slots__ = ('points', 'time', 'capture_ts')
+
+    def __init__(self, points, time, capture_ts):
+        self.points = points
+        self.time = time
+        self.capture_ts = capture_ts
+
+
+class LandmarkTrack:
+    # The last two inference results of a stream, sampled at arbitrary times. Written by the
+    # inference side and read by the scheduler; not thread-safe itself, callers hold the owning
+    # LandmarkOutput's lock around every push, sample and reset.
+    def __init__(self, mode=None, extrapolate_limit=None, max_speed=None):
+        self.mode = mode or global_vars.OUTPUT_MODE
+        self.extrapolate_limit = global_vars.OUTPUT_EXTRAPOLATE_LIMIT if extrapolate_limit is None else extrapolate_limit
+        self.max_speed = global_vars.OUTPUT_MAX_SPEED if max_speed is None else max_speed
+        self.reset()
+
+    def reset(self):
+        self.samples = (None, None)
+        self.interval = None
+
+    def push(self, points, now, capture_ts=0.0):
+        last = self.samples[1]
+        if last is not None and now > last.time:
+            gap = now - last.time
+            self.interval = gap if self.interval is None else self.interval + INTERVAL_SMOOTHING * (gap - self.interval)
+        self.samples = (last, LandmarkSample(points.copy(), now, capture_ts))
+
+    def latest(self):
+        return self.samples[1]
+
+    def sample(self, now):
+        # Returns the points to show at `now`, or None before the first result
+        prev, last = self.samples
+        if last is None:
+            return None
+        if prev is None or last.time <= prev.time:
+            return last.points
+
+        render_time = now
+        if self.mode == "interpolate" and self.interval is not None:
+            # Render one inference interval in the past, so the render time usually lies between the two results
+            render_time = now - min(self.interval, MAX_INTERP_DELAY)
+
+        span = last.time - prev.time
+        alpha = (render_time - prev.time) / span
+        if alpha <= 0:
+            return prev.points
+        if alpha <= 1:
+            return prev.points + (last.points - prev.points) * np.float32(alpha)
+
+        # Past the newest result: carry on at its velocity, clamped per joint, for a limited time
+        horizon = min(render_time - last.time, self.extrapolate_limit)
+        velocity = (last.points[:, :3] - prev.points[:, :3]) / np.float32(span)
+        speed = np.linalg.norm(velocity, axis=1, keepdims=True)
+        velocity *= np.minimum(1.0, self.max_speed / np.maximum(speed, 1e-9)).astype(np.float32)
+        points = last.points.copy()
+        points[:, :3] += velocity * np.float32(horizon)
+        return points
+
+
+class OutputScheduler(threading.Thread):
+    # One thread ticking every registered body.LandmarkOutput at a fixed rate, so Unity gets
+    # evenly spaced packets whatever the camera and model rates are
+    def __init__(self, rate=None):
+        super().__init__()
+        self.daemon = True
+        self.rate = rate or global_vars.OUTPUT_RATE_HZ
+        self.outputs = []
+        self.lock = threading.Lock()
+
+    def add(self, output):
+        with self.lock:
+            self.outputs = self.outputs + [output]
+
+    def remove(self, output):
+        with self.lock:
+            self.outputs = [o for o in self.outputs if o is not output]
+
+    def run(self):
+        print(f"{DEBUG_PREFIX}Output scheduler running at {self.rate} Hz")
+        interval = 1.0 / self.rate
+        next_tick = time.time()
+        while not global_vars.KILL_THREADS:
+            now = time.time()
+            for output in self.outputs:
+                try:
+                    self.tick(output, now)
+                except Exception as e:
+                    print(f"{DEBUG_PREFIX}Output error on port {output.output_port}: {e}")
+
+            next_tick += interval
+            delay = next_tick - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.time()  # Fell behind, skip the missed ticks
+
+    def tick(self, output, now):
+        with output.lock:
+            track = output.output_track
+            latest = track.latest()
+            # Nothing to show yet, or the stream went quiet: stop rather than repeat a frozen pose
+            if latest is None or now - latest.time > global_vars.OUTPUT_HOLD_TIME:
+                return
+            points = track.sample(now)
+            output.send_landmarks(points, capture_ts=latest.capture_ts)
+
+
+_output_scheduler = None
+_output_scheduler_lock = threading.Lock()
+
+
+def get_output_scheduler():
+    # Started on first use by the first LandmarkOutput with a fixed rate
+    global _output_scheduler
+    with _output_scheduler_lock:
+        if _output_scheduler is None:
+            _output_scheduler = OutputScheduler()
+            _output_scheduler.start()
+        return _output_scheduler
@@ -0,0 +1,265 @@
+# Multi-process pose inference with shared-memory frame and landmark handoff
+import multiprocessing
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait
+
+import cv2
+import numpy as np
+
+import global_vars
+from body import (BodyThread, LandmarkSmoother, create_pose, landmarks_to_array, warm_up, DEBUG_PREFIX,
+                  PROCESS_WIDTH, PROCESS_HEIGHT)
+
+FRAME_SHAPE = (PROCESS_HEIGHT, PROCESS_WIDTH, 3)
+FRAME_SLOTS = 2  # One frame in flight per stream, one waiting behind it
+LANDMARK_SHAPE = (33, 4)  # x, y, z, visibility
+
+# Control messages are a few packed bytes over a pipe; frames and landmarks never go through it
+MESSAGE = struct.Struct('!BHB')  # kind, stream index, slot
+MSG_FRAME = 0
+MSG_RESULT = 1
+MSG_NO_POSE = 2
+MSG_STOP = 3
+MSG_RELEASE = 4  # Close a stream's Pose graph; it is rebuilt by the stream's next frame
+
+
+class SharedArray:
+    # A numpy array backed by a named shared memory block
+    def __init__(self, shape, dtype, name=None):
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _worker_main(worker_index, stream_count, frames_name, results_name, conn):
+    # Each worker owns the Pose graphs and smoothers of the streams routed to it
+    frames = SharedArray((stream_count, FRAME_SLOTS) + FRAME_SHAPE, np.uint8, frames_name)
+    results = SharedArray((stream_count,) + LANDMARK_SHAPE, np.float32, results_name)
+    poses = {}
+    smoothers = {}
+    spare = None
+    try:
+        # Workers start in parallel, so each warms one graph up front for the first stream it gets
+        if global_vars.POSE_PREWARM:
+            started = time.time()
+            spare = warm_up(create_pose())
+            print(f"{DEBUG_PREFIX}Pose worker {worker_index} warmed a model in {time.time() - started:.2f}s")
+
+        while True:
+            kind, stream, slot = MESSAGE.unpack(conn.recv_bytes())
+            if kind == MSG_STOP:
+                break
+            if kind == MSG_RELEASE:
+                pose = poses.pop(stream, None)
+                smoothers.pop(stream, None)
+                if pose is not None:
+                    pose.close()
+                continue
+
+            pose = poses.get(stream)
+            if pose is None:
+                pose = poses[stream] = spare or create_pose()
+                spare = None
+                smoothers[stream] = LandmarkSmoother()
+
+            reply = MSG_NO_POSE
+            try:
+                image = cv2.cvtColor(frames.array[stream, slot], cv2.COLOR_BGR2RGB)
+                image.flags.writeable = False
+                world_landmarks = pose.process(image).pose_world_landmarks
+                if world_landmarks:
+                    points = landmarks_to_array(world_landmarks, with_visibility=True)
+                    out = results.array[stream]
+                    out[:, :3] = smoothers[stream].smooth(points[:, :3], time.time())
+                    out[:, 3] = points[:, 3]
+                    reply = MSG_RESULT
+            except Exception as e:
+                print(f"{DEBUG_PREFIX}Pose worker {worker_index} error on stream {stream}: {e}")
+            conn.send_bytes(MESSAGE.pack(reply, stream, slot))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        for pose in poses.values():
+            pose.close()
+        if spare is not None:
+            spare.close()
+        frames.close()
+        results.close()
+
+
+class PoolStream:
+    def __init__(self, worker):
+        self.worker = worker
+        self.lock = threading.Lock()
+        self.in_flight = None  # Slot the worker is reading
+        self.waiting = None  # Newest frame, queued behind the in-flight one
+        self.submit_time = 0.0
+        self.meta = [None] * FRAME_SLOTS  # Caller's tag for the frame in each slot, handed back with its result
+        self.callback = None
+        self.dropped = 0
+        self.loaded = False  # The worker builds the stream's graph with its first frame
+
+
+class PoseProcessPool:
+    # Streams are pinned to workers (stream index modulo worker count) so each MediaPipe graph
+    # keeps its tracking state; the number of workers is independent of the number of streams
+    def __init__(self, stream_count, worker_count=global_vars.POSE_WORKERS):
+        self.stream_count = stream_count
+        self.worker_count = max(1, min(worker_count, stream_count))
+        self.frames = SharedArray((stream_count, FRAME_SLOTS) + FRAME_SHAPE, np.uint8)
+        self.results = SharedArray((stream_count,) + LANDMARK_SHAPE, np.float32)
+
+        self.processes = []
+        self.conns = []
+        self.send_locks = []
+        for worker_index in range(self.worker_count):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_worker_main,
+                args=(worker_index, stream_count, self.frames.name, self.results.name, child_conn),
+                daemon=True)
+            self.processes.append(process)
+            self.conns.append(parent_conn)
+            self.send_locks.append(threading.Lock())
+
+        self.streams = [PoolStream(i % self.worker_count) for i in range(stream_count)]
+        self.collector = threading.Thread(target=self._collect, daemon=True)
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        self.collector.start()
+        print(f"{DEBUG_PREFIX}Pose pool started: {self.worker_count} workers for {self.stream_count} streams")
+
+    def register(self, stream, callback):
+        # callback(landmarks, latency, meta) is called on the collector thread; landmarks is a
+        # (33, 4) array only valid during the call, or None when no pose was found
+        self.streams[stream].callback = callback
+
+    def unregister(self, stream):
+        state = self.streams[stream]
+        with state.lock:
+            state.callback = None
+            state.waiting = None
+        self.release(stream)
+
+    def release(self, stream):
+        # Frees the stream's Pose graph in its worker, e.g. when the stream has been idle for a while
+        self.streams[stream].loaded = False
+        worker = self.streams[stream].worker
+        try:
+            with self.send_locks[worker]:
+                self.conns[worker].send_bytes(MESSAGE.pack(MSG_RELEASE, stream, 0))
+        except OSError:
+            pass
+
+    def submit(self, stream, frame, meta=None):
+        state = self.streams[stream]
+        with state.lock:
+            slot = 0 if state.in_flight is None else 1 - state.in_flight
+            np.copyto(self.frames.array[stream, slot], frame)
+            state.meta[slot] = meta
+            state.loaded = True
+            if state.in_flight is None:
+                self._dispatch(stream, slot)
+            else:
+                # Newest frame wins, an older waiting frame is simply overwritten
+                if state.waiting is not None:
+                    state.dropped += 1
+                state.waiting = slot
+
+    def _dispatch(self, stream, slot):
+        # Called with the stream lock held
+        state = self.streams[stream]
+        state.in_flight = slot
+        state.submit_time = time.time()
+        with self.send_locks[state.worker]:
+            self.conns[state.worker].send_bytes(MESSAGE.pack(MSG_FRAME, stream, slot))
+
+    def _collect(self):
+        live = list(self.conns)
+        while live and not global_vars.KILL_THREADS:
+            for conn in wait(live, timeout=0.1):
+                try:
+                    kind, stream, slot = MESSAGE.unpack(conn.recv_bytes())
+                except (EOFError, OSError):
+                    live.remove(conn)
+                    continue
+
+                state = self.streams[stream]
+                latency = time.time() - state.submit_time
+                if state.callback is not None:
+                    landmarks = self.results.array[stream] if kind == MSG_RESULT else None
+                    try:
+                        state.callback(landmarks, latency, state.meta[slot])
+                    except Exception as e:
+                        print(f"{DEBUG_PREFIX}Pose pool callback error on stream {stream}: {e}")
+
+                with state.lock:
+                    state.in_flight = None
+                    if state.waiting is not None:
+                        waiting, state.waiting = state.waiting, None
+                        self._dispatch(stream, waiting)
+
+    def close(self):
+        for worker_index, conn in enumerate(self.conns):
+            try:
+                with self.send_locks[worker_index]:
+                    conn.send_bytes(MESSAGE.pack(MSG_STOP, 0, 0))
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+        self.frames.close()
+        self.results.close()
+
+
+class PooledBodyThread(BodyThread):
+    # Decodes frames for one stream and hands them to a PoseProcessPool instead of running Pose itself
+    def __init__(self, input_port, output_port, pool, stream, receiver=None):
+        super().__init__(input_port, output_port, receiver)
+        self.pool = pool
+        self.stream = stream
+        pool.register(stream, self.handle_result)
+
+    def run(self):
+        if self.owns_receiver:
+            self.receiver.start()
+        self.output.start()
+
+        while not global_vars.KILL_THREADS and not self.stopped:
+            frame = self.next_frame()
+            if frame is not None and not self.skip_static(frame):
+                self.pool.submit(self.stream, frame.image, frame)
+
+        self.shutdown()
+
+    def model_loaded(self):
+        return self.pool.streams[self.stream].loaded
+
+    def release_model(self):
+        # The graph lives in the worker process, which creates it again on the next frame
+        self.pool.release(self.stream)
+
+    def handle_result(self, landmarks, latency, frame):
+        # Worker time includes cvtColor and smoothing
+        self.metrics.observe('inference', latency)
+        if landmarks is not None:
+            self.output.publish(landmarks.copy(), frame)
+        self.record_stats(latency)
@@ -0,0 +1,134 @@
+# Same-host camera transport: raw BGR frames in a shared memory ring instead of JPEG over UDP
+#
+# camera_sender writes each frame, already resized to the pose input size, into the ring for its
+# target port and sends a KIND_SHM_FRAME datagram to that port; UDPFrameReceiver then copies the
+# newest frame out of the ring, skipping reassembly, JPEG decode and resize.
+#
+# Ring layout: RING_HEADER, then `slots` slots of SLOT_HEADER + pixels. Each slot is guarded by a
+# sequence counter that is odd while the writer is inside it, so a reader that raced the writer
+# sees a different (or odd) sequence after copying and drops the torn frame.
+import struct
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+RING_MAGIC = b'AVSHM001'
+# magic, width, height, slot count, frames written
+RING_HEADER = struct.Struct('<8sIIIxxxxQ')
+RING_COUNTER_OFFSET = RING_HEADER.size - 8
+# sequence, frame id, capture timestamp
+SLOT_HEADER = struct.Struct('<QIxxxxd')
+SEQUENCE = struct.Struct('<Q')
+ALIGNMENT = 64
+
+RING_SLOTS = 3  # The reader copies one slot while the writer fills another
+
+
+def ring_name(port, stream_id):
+    return f"avatar_{port}_{stream_id}"
+
+
+def slot_stride(width, height):
+    size = SLOT_HEADER.size + width * height * 3
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def ring_size(width, height, slots):
+    return ALIGNMENT + slots * slot_stride(width, height)
+
+
+def attach(name):
+    # Attach without registering with this process's resource tracker, which would otherwise
+    # unlink the writer's block when this process exits
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SharedFrameWriter:
+    def __init__(self, port, stream_id, width, height, slots=RING_SLOTS):
+        self.name = ring_name(port, stream_id)
+        self.width = width
+        self.height = height
+        self.slots = slots
+        self.stride = slot_stride(width, height)
+        size = ring_size(width, height, slots)
+        try:
+            self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by an earlier sender; reused if compatible so attached receivers stay valid
+            self.shm = attach(self.name)
+            magic, w, h, n, _ = RING_HEADER.unpack_from(self.shm.buf)
+            if (magic, w, h, n) != (RING_MAGIC, width, height, slots) or self.shm.size < size:
+                self.shm.close()
+                shared_memory.SharedMemory(name=self.name).unlink()
+                self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=size)
+        self.counter = RING_HEADER.unpack_from(self.shm.buf)[4] if self.shm.buf[:8] == RING_MAGIC else 0
+        RING_HEADER.pack_into(self.shm.buf, 0, RING_MAGIC, width, height, slots, self.counter)
+        self.pixels = [self.slot_pixels(index) for index in range(slots)]
+
+    def slot_offset(self, index):
+        return ALIGNMENT + index * self.stride
+
+    def slot_pixels(self, index):
+        offset = self.slot_offset(index) + SLOT_HEADER.size
+        return np.ndarray((self.height, self.width, 3), np.uint8, self.shm.buf, offset)
+
+    def write(self, frame, frame_id, capture_ts):
+        index = self.counter % self.slots
+        offset = self.slot_offset(index)
+        sequence = SEQUENCE.unpack_from(self.shm.buf, offset)[0]
+        SEQUENCE.pack_into(self.shm.buf, offset, sequence + 1)
+        if frame.shape[:2] == (self.height, self.width):
+            np.copyto(self.pixels[index], frame)
+        else:
+            cv2.resize(frame, (self.width, self.height), dst=self.pixels[index], interpolation=cv2.INTER_AREA)
+        SLOT_HEADER.pack_into(self.shm.buf, offset, sequence + 2, frame_id & 0xFFFFFFFF, capture_ts)
+        self.counter += 1
+        struct.pack_into('<Q', self.shm.buf, RING_COUNTER_OFFSET, self.counter)
+
+    def close(self):
+        self.pixels = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedFrameReader:
+    def __init__(self, port, stream_id):
+        self.shm = attach(ring_name(port, stream_id))
+        magic, self.width, self.height, self.slots, _ = RING_HEADER.unpack_from(self.shm.buf)
+        if magic != RING_MAGIC:
+            self.shm.close()
+            raise ValueError(f"{ring_name(port, stream_id)} is not a frame ring")
+        self.stride = slot_stride(self.width, self.height)
+        self.last_counter = 0
+        self.misses = 0  # Notifications in a row with nothing new, e.g. the sender restarted on a new block
+
+    def read_latest(self):
+        # Returns (image, frame_id, capture_ts) for a frame not returned before, or None
+        counter = struct.unpack_from('<Q', self.shm.buf, RING_COUNTER_OFFSET)[0]
+        if counter == self.last_counter or counter == 0:
+            self.misses += 1
+            return None
+        self.misses = 0
+        offset = ALIGNMENT + (counter - 1) % self.slots * self.stride
+        sequence, frame_id, capture_ts = SLOT_HEADER.unpack_from(self.shm.buf, offset)
+        if sequence & 1:
+            return None
+        pixels = np.ndarray((self.height, self.width, 3), np.uint8, self.shm.buf, offset + SLOT_HEADER.size)
+        image = pixels.copy()
+        del pixels
+        if SEQUENCE.unpack_from(self.shm.buf, offset)[0] != sequence:
+            return None  # Overwritten while copying
+        self.last_counter = counter
+        return image, frame_id, capture_ts
+
+    def close(self):
+        self.shm.close()
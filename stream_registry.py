@@ -0,0 +1,152 @@
+# Camera streams that can be added and removed while the server runs, plus a small local HTTP API
+#
+#   curl localhost:9101/streams                       list streams and their state
+#   curl -X POST localhost:9101/streams/52708         start receiving on 52708 (output port from get_output_port)
+#   curl -X POST localhost:9101/streams/52708 -d '{"output_port": 52800}'
+#   curl -X DELETE localhost:9101/streams/52708       stop it and release its socket and model
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import global_vars
+from body import BodyThread, UDPFrameReceiver, FRAME_WAIT_TIMEOUT
+from multi_pose import MultiPoseBodyThread
+from pose_pool import PooledBodyThread
+
+# Debug prefix for easy removal
+DEBUG_PREFIX = "DEBUG_"
+
+
+class StreamRegistry:
+    def __init__(self, ingest=None, pool=None):
+        self.ingest = ingest  # IngestLoop receiving every stream, or None for a receiver thread per stream
+        self.pool = pool  # PoseProcessPool, or None for inference in each body thread
+        self.threads = {}  # input port -> body thread
+        self.lock = threading.Lock()
+        # Pool streams are fixed slots in its shared memory, handed out as streams come and go
+        self.free_slots = list(range(pool.stream_count)) if pool is not None else []
+
+    def add(self, input_port, output_port=None):
+        if output_port is None:
+            output_port = global_vars.get_output_port(input_port)
+        if not valid_port(output_port):
+            raise ValueError(f"output_port must be an integer from 1 to 65535, got {output_port!r}")
+        with self.lock:
+            if input_port in self.threads:
+                raise KeyError(f"port {input_port} is already streaming")
+            if self.pool is not None and not self.free_slots:
+                raise RuntimeError(f"pose pool is full ({self.pool.stream_count} streams)")
+
+            # Bind first, so a port in use fails before anything else is set up
+            receiver = None
+            if self.ingest is not None:
+                receiver = UDPFrameReceiver(input_port)
+                self.ingest.add(receiver)
+            try:
+                if self.pool is not None:
+                    thread = PooledBodyThread(input_port, output_port, self.pool, self.free_slots[0], receiver)
+                    self.free_slots.pop(0)
+                elif global_vars.POSE_ENGINE == "landmarker":
+                    thread = MultiPoseBodyThread(input_port, output_port, receiver)
+                else:
+                    thread = BodyThread(input_port, output_port, receiver)
+            except Exception:
+                # Release the port so it can be added again
+                if receiver is not None:
+                    self.ingest.remove(receiver)
+                raise
+            self.threads[input_port] = thread
+        thread.start()
+        return thread
+
+    def remove(self, input_port):
+        with self.lock:
+            thread = self.threads.pop(input_port)
+        thread.stop()
+        thread.join(FRAME_WAIT_TIMEOUT * 4)
+        # Wait for the socket to close so the port can be added again right away
+        if thread.owns_receiver:
+            thread.receiver.join(FRAME_WAIT_TIMEOUT)
+        else:
+            self.ingest.remove(thread.receiver)
+        if self.pool is not None:
+            self.pool.unregister(thread.stream)
+            with self.lock:
+                self.free_slots.append(thread.stream)
+
+    def describe(self):
+        with self.lock:
+            threads = sorted(self.threads.items())
+        return [{"input_port": port, "output_port": thread.output_port, "state": thread.state,
+                 "model_loaded": thread.model_loaded()}
+                for port, thread in threads]
+
+
+def valid_port(port):
+    return isinstance(port, int) and not isinstance(port, bool) and 0 < port < 65536
+
+
+class ControlHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/streams':
+            self.reply(404, {"error": "not found"})
+            return
+        self.reply(200, self.registry.describe())
+
+    def do_POST(self):
+        port = self.stream_port()
+        if port is None:
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            options = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(options, dict):
+                raise ValueError("request body must be a JSON object")
+            thread = self.registry.add(port, options.get('output_port'))
+        except KeyError as e:
+            self.reply(409, {"error": e.args[0]})
+        except (ValueError, RuntimeError, OSError) as e:
+            self.reply(400, {"error": str(e)})
+        else:
+            self.reply(201, {"input_port": port, "output_port": thread.output_port})
+
+    def do_DELETE(self):
+        port = self.stream_port()
+        if port is None:
+            return
+        try:
+            self.registry.remove(port)
+        except KeyError:
+            self.reply(404, {"error": f"port {port} is not streaming"})
+        else:
+            self.reply(200, {"input_port": port})
+
+    def stream_port(self):
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'streams' or not parts[1].isdigit() or not valid_port(int(parts[1])):
+            self.reply(404, {"error": "expected /streams/<port>"})
+            return None
+        return int(parts[1])
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_control_server(registry, port, host='127.0.0.1'):
+    # Local only: anyone who can reach it can open ports on this machine
+    handler = type('BoundControlHandler', (ControlHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"{DEBUG_PREFIX}Stream control API at http://{host}:{port}/streams")
+    return server
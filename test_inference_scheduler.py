@@ -0,0 +1,98 @@
+# A stream whose model is slow to build must still get inference turns under the fair scheduler
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import global_vars
+from benchmark import StubPose
+from body import BodyThread, DecodedFrame, DecodedFrameSource, InferenceScheduler, StreamStats
+
+MODEL_BUILD_TIME = 0.6
+FRAME_INTERVAL = 1 / 30
+
+
+class SlowBuildPose(StubPose):
+    def __init__(self):
+        time.sleep(MODEL_BUILD_TIME)
+        super().__init__()
+
+
+class CameraSource(DecodedFrameSource):
+    # Fresh frames with synced capture timestamps, as a UDPFrameReceiver would hand them over
+    def __init__(self, stream_id):
+        super().__init__()
+        self.stats = StreamStats()
+        self.stream_id = stream_id
+        self.isRunning = True
+        self.image = np.zeros((48, 64, 3), np.uint8)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        frame_id = 0
+        while self.isRunning:
+            self.publish_decoded(DecodedFrame(self.image, self.stream_id, frame_id, time.time()))
+            frame_id += 1
+            time.sleep(FRAME_INTERVAL)
+
+
+@pytest.fixture
+def scheduling(monkeypatch):
+    monkeypatch.setattr(global_vars, 'HOST', '127.0.0.1')
+    monkeypatch.setattr(global_vars, 'FAIR_SCHEDULING', True)
+    monkeypatch.setattr(global_vars, 'MOTION_GATE', False)
+    monkeypatch.setattr(global_vars, 'OUTPUT_RATE_HZ', 0)
+    monkeypatch.setattr(global_vars, 'STALE_FRAME_DEADLINE_MS', 250)
+
+
+def test_slow_model_build_does_not_starve_stream(scheduling):
+    port = 53990
+    source = CameraSource(port)
+    thread = BodyThread(port, global_vars.get_output_port(port), source, SlowBuildPose)
+    sent = []
+    publish = thread.output.publish
+    thread.output.publish = lambda points, frame: (sent.append(frame.frame_id), publish(points, frame))
+
+    source.thread.start()
+    thread.start()
+    time.sleep(MODEL_BUILD_TIME + 2.0)
+    thread.stop()
+    source.isRunning = False
+    thread.join(2)
+
+    # About 60 frames arrive after the model is built; most of them must be inferred
+    assert len(sent) > 30
+    assert thread.share.cost < MODEL_BUILD_TIME / 10
+
+
+def test_cost_estimate_averages_first_turns():
+    scheduler = InferenceScheduler(slots=1)
+    share = scheduler.register(53991)
+    for seconds in (0.5, 0.01, 0.01, 0.01):
+        scheduler.running += 1
+        scheduler.done(share, seconds)
+    assert share.cost == pytest.approx(0.1325)
+    scheduler.running += 1
+    scheduler.done(share, None)  # Failed turn: no sample
+    assert share.cost == pytest.approx(0.1325)
+    scheduler.unregister(share)
+
+
+def test_deadline_counts_to_inference_start(scheduling):
+    scheduler = InferenceScheduler(slots=1)
+    share = scheduler.register(53992)
+    share.cost = 0.2
+    now = time.time()
+    # Finishes past the deadline, but still starts within it
+    share.request = DecodedFrame(None, 53992, 0, now - 0.1)
+    with scheduler.cond:
+        scheduler.dispatch(now)
+    assert share.granted
+    scheduler.done(share, 0.2)
+
+    share.request = DecodedFrame(None, 53992, 1, now - 0.3)
+    with scheduler.cond:
+        scheduler.dispatch(now)
+    assert share.request is None and not share.granted
+    scheduler.unregister(share)
@@ -0,0 +1,103 @@
+# Round trips through the landmark wire formats
+import numpy as np
+import pytest
+
+from landmark_codec import (FLAG_KEYFRAME, FLAG_VISIBILITY, LANDMARK_COUNT, QUANT_LIMIT, QuantizedLandmarkDecoder,
+                            QuantizedLandmarkEncoder, decode_binary, encode_binary)
+
+RESOLUTION = 0.0001
+THRESHOLD = 0.001
+# float32 resolution in the header and float32 output add a little on top of the quantization error
+EPSILON = 1e-6
+
+
+def random_points(rng, scale=1.0):
+    return rng.uniform(-scale, scale, (LANDMARK_COUNT, 3)).astype(np.float32)
+
+
+def test_quantized_round_trip_within_half_a_step():
+    rng = np.random.default_rng(0)
+    encoder = QuantizedLandmarkEncoder(RESOLUTION, 0.0, keyframe_interval=10)
+    decoder = QuantizedLandmarkDecoder()
+    for frame_id in range(25):
+        points = random_points(rng)
+        frame = decoder.decode(encoder.encode(points, 1, frame_id, 0.0))
+        assert np.abs(frame.points - points).max() <= RESOLUTION / 2 + EPSILON
+
+
+def test_unsent_joints_within_threshold():
+    rng = np.random.default_rng(1)
+    encoder = QuantizedLandmarkEncoder(RESOLUTION, THRESHOLD, keyframe_interval=1000)
+    decoder = QuantizedLandmarkDecoder()
+    points = random_points(rng)
+    decoded = decoder.decode(encoder.encode(points, 1, 0, 0.0)).points
+    for frame_id in range(1, 50):
+        # Mostly jitter below the threshold, now and then a real move
+        points = points + rng.uniform(-THRESHOLD / 3, THRESHOLD / 3, points.shape).astype(np.float32)
+        if frame_id % 7 == 0:
+            points[frame_id % LANDMARK_COUNT] += 0.05
+        packet = encoder.encode(points, 1, frame_id, 0.0)
+        if packet is not None:
+            decoded = decoder.decode(packet).points
+        assert np.abs(decoded - points).max() <= THRESHOLD + RESOLUTION / 2 + EPSILON
+
+
+def test_quantized_clamps_out_of_range():
+    encoder = QuantizedLandmarkEncoder(RESOLUTION, 0.0, keyframe_interval=1)
+    decoder = QuantizedLandmarkDecoder()
+    points = np.zeros((LANDMARK_COUNT, 3), np.float32)
+    points[0] = (10.0, -10.0, 1.0)
+    decoded = decoder.decode(encoder.encode(points, 1, 0, 0.0)).points
+    limit = QUANT_LIMIT * RESOLUTION
+    assert decoded[0, 0] == pytest.approx(limit, abs=EPSILON)
+    assert decoded[0, 1] == pytest.approx(-limit, abs=EPSILON)
+    assert decoded[0, 2] == pytest.approx(1.0, abs=RESOLUTION / 2 + EPSILON)
+
+
+def test_lost_delta_marks_stale_until_keyframe():
+    encoder = QuantizedLandmarkEncoder(RESOLUTION, 0.0, keyframe_interval=4)
+    decoder = QuantizedLandmarkDecoder()
+    points = np.zeros((LANDMARK_COUNT, 3), np.float32)
+    packets = []
+    for frame_id in range(5):
+        points[0, 0] = 0.01 * (frame_id + 1)
+        packets.append(encoder.encode(points, 1, frame_id, 0.0))
+
+    decoder.decode(packets[0])
+    assert not decoder.stale
+    decoder.decode(packets[2])  # packets[1] lost
+    assert decoder.stale
+    decoder.decode(packets[3])
+    assert decoder.stale
+    keyframe = decoder.decode(packets[4])
+    assert keyframe.flags & FLAG_KEYFRAME
+    assert not decoder.stale
+    assert keyframe.points[0, 0] == pytest.approx(0.05, abs=RESOLUTION / 2 + EPSILON)
+
+
+def test_decoder_waits_for_first_keyframe():
+    encoder = QuantizedLandmarkEncoder(RESOLUTION, 0.0, keyframe_interval=10)
+    points = np.zeros((LANDMARK_COUNT, 3), np.float32)
+    encoder.encode(points, 1, 0, 0.0)
+    points[3, 1] = 0.2
+    assert QuantizedLandmarkDecoder().decode(encoder.encode(points, 1, 1, 0.0)) is None
+
+
+@pytest.mark.parametrize("with_visibility", [False, True])
+def test_binary_round_trip(with_visibility):
+    rng = np.random.default_rng(2)
+    points = rng.uniform(-2, 2, (LANDMARK_COUNT, 4)).astype(np.float32)
+    frame = decode_binary(encode_binary(points, 52700, 123456, 1700000000.25, with_visibility))
+    assert frame.stream_id == 52700
+    assert frame.frame_id == 123456
+    assert frame.capture_ts == 1700000000.25
+    assert bool(frame.flags & FLAG_VISIBILITY) == with_visibility
+    expected = points if with_visibility else points[:, :3]
+    np.testing.assert_array_equal(frame.points, expected)
+
+
+def test_binary_without_visibility_column():
+    points = np.ones((LANDMARK_COUNT, 3), np.float32)
+    frame = decode_binary(encode_binary(points, 1, 0, 0.0, with_visibility=True))
+    assert not frame.flags & FLAG_VISIBILITY
+    np.testing.assert_array_equal(frame.points, points)
@@ -0,0 +1,185 @@
+# Record raw camera datagrams to a memory-mapped file and replay them to UDPFrameReceiver ports
+#
+#   python udp_replay.py record capture.avrec                   (records global_vars.INPUT_PORTS)
+#   python udp_replay.py replay capture.avrec --speed 4         (4x recorded speed)
+#   python udp_replay.py replay capture.avrec --speed 0 --loop  (as fast as possible, forever)
+import argparse
+import mmap
+import selectors
+import socket
+import struct
+import time
+
+import global_vars
+from frame_protocol import HEADER_SIZE, KIND_CHUNK, ProtocolError, unpack_header
+
+# File layout: magic, then the end offset of the last complete record (kept up to date so a
+# recording cut short by a crash is still readable), then records back to back
+FILE_MAGIC = b'AVREC001'
+FILE_HEADER = struct.Struct('<8sQ')
+# Per datagram: arrival timestamp, destination port, payload length
+RECORD = struct.Struct('<dHI')
+
+GROW_SIZE = 64 * 1024 * 1024  # File is extended (and remapped) in steps this big
+CAPTURE_TS_OFFSET = HEADER_SIZE - 8  # capture_ts is the last header field
+
+# Debug prefix for easy removal
+DEBUG_PREFIX = "DEBUG_"
+
+
+class DatagramRecorder:
+    def __init__(self, path):
+        self.file = open(path, 'w+b')
+        self.size = 0
+        self.map = None
+        self.end = FILE_HEADER.size
+        self.count = 0
+        self._grow(FILE_HEADER.size + RECORD.size)
+        FILE_HEADER.pack_into(self.map, 0, FILE_MAGIC, self.end)
+
+    def _grow(self, needed):
+        if self.map is not None:
+            self.map.flush()
+            self.map.close()
+        while self.size < needed:
+            self.size += GROW_SIZE
+        self.file.truncate(self.size)
+        self.map = mmap.mmap(self.file.fileno(), self.size)
+
+    def append(self, port, arrival_ts, data):
+        length = len(data)
+        end = self.end + RECORD.size + length
+        if end > self.size:
+            self._grow(end)
+        RECORD.pack_into(self.map, self.end, arrival_ts, port, length)
+        self.map[self.end + RECORD.size:end] = data
+        self.end = end
+        self.count += 1
+        # Publish the record only once it is fully written
+        struct.pack_into('<Q', self.map, 8, end)
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.truncate(self.end)
+        self.file.close()
+
+
+def read_records(path):
+    # Yields (arrival_ts, port, payload memoryview) for every complete record
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, end = FILE_HEADER.unpack_from(data)
+    if magic != FILE_MAGIC:
+        raise ValueError(f"{path} is not a datagram recording")
+    view = memoryview(data)
+    offset = FILE_HEADER.size
+    while offset + RECORD.size <= end:
+        arrival_ts, port, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        yield arrival_ts, port, view[offset:offset + length]
+        offset += length
+
+
+def record(path, ports, host, duration=None):
+    selector = selectors.DefaultSelector()
+    for port in ports:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        sock.bind((host, port))
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ, port)
+
+    recorder = DatagramRecorder(path)
+    buffer = bytearray(65536)
+    view = memoryview(buffer)
+    started = time.time()
+    print(f"{DEBUG_PREFIX}Recording ports {ports} to {path}")
+    try:
+        while duration is None or time.time() - started < duration:
+            for key, _ in selector.select(timeout=0.1):
+                while True:
+                    try:
+                        nbytes = key.fileobj.recv_into(buffer)
+                    except BlockingIOError:
+                        break
+                    recorder.append(key.data, time.time(), view[:nbytes])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.close()
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+    print(f"{DEBUG_PREFIX}Recorded {recorder.count} datagrams ({recorder.end} bytes)")
+
+
+def replay(path, host, speed=1.0, loop=False, restamp=True, port_offset=0):
+    # speed: 1.0 = recorded timing, N = N times faster, 0 = as fast as possible.
+    # restamp rewrites capture timestamps so each frame looks as old on arrival as it did when
+    # recorded, keeping the staleness deadline and age metrics meaningful.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * 1024 * 1024)
+    scratch = bytearray(65536)
+    sent = 0
+    while True:
+        first_ts = None
+        started = time.time()
+        for arrival_ts, port, payload in read_records(path):
+            if first_ts is None:
+                first_ts = arrival_ts
+            send_ts = started + (arrival_ts - first_ts) / speed if speed > 0 else time.time()
+            delay = send_ts - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+            if restamp:
+                payload = restamp_chunk(payload, scratch, arrival_ts, send_ts)
+            sock.sendto(payload, (host, port + port_offset))
+            sent += 1
+        print(f"{DEBUG_PREFIX}Replayed {sent} datagrams in {time.time() - started:.2f}s")
+        if not loop:
+            break
+    sock.close()
+
+
+def restamp_chunk(payload, scratch, arrival_ts, send_ts):
+    try:
+        header = unpack_header(payload)
+    except ProtocolError:
+        return payload
+    if header.kind != KIND_CHUNK or header.capture_ts <= 0:
+        return payload
+    length = len(payload)
+    scratch[:length] = payload
+    struct.pack_into('!d', scratch, CAPTURE_TS_OFFSET, send_ts - (arrival_ts - header.capture_ts))
+    return memoryview(scratch)[:length]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record or replay camera UDP traffic")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    rec = sub.add_parser('record', help="capture datagrams arriving on the input ports")
+    rec.add_argument('path')
+    rec.add_argument('--host', default=global_vars.HOST)
+    rec.add_argument('--ports', type=int, nargs='+', default=global_vars.INPUT_PORTS)
+    rec.add_argument('--duration', type=float, default=None, help="seconds, default until Ctrl+C")
+
+    rep = sub.add_parser('replay', help="send a recording to UDPFrameReceiver ports")
+    rep.add_argument('path')
+    rep.add_argument('--host', default='127.0.0.1')
+    rep.add_argument('--speed', type=float, default=1.0, help="1 = recorded speed, 0 = as fast as possible")
+    rep.add_argument('--loop', action='store_true')
+    rep.add_argument('--no-restamp', action='store_true', help="keep the recorded capture timestamps")
+    rep.add_argument('--port-offset', type=int, default=0, help="added to every recorded port")
+
+    args = parser.parse_args()
+    if args.command == 'record':
+        record(args.path, args.ports, args.host, args.duration)
+    else:
+        replay(args.path, args.host, args.speed, args.loop, not args.no_restamp, args.port_offset)
+
+
+if __name__ == "__main__":
+    main()
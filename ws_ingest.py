@@ -0,0 +1,183 @@
+# WebSocket ingest for friend_camera.FriendCameraClient, feeding the same decode and pose pipeline as UDP cameras
+#
+# A connection registers with {"type": "camera_feed", "username": ...} and gets back its user id, color
+# and output port. Frames then arrive as binary messages, WS_FRAME_HEADER followed by the JPEG, or as
+# the older base64 JSON {"type": "frame", ...}. {"type": "clock_ping", "t0": ...} is answered with
+# {"type": "clock_pong", "t0": ..., "server_time": ...} at any time.
+import asyncio
+import base64
+import itertools
+import json
+import struct
+import threading
+import time
+
+import websockets
+
+import global_vars
+from body import (BodyThread, DecodedFrame, DecodedFrameSource, StreamStats, decode_jpeg, frame_age, get_decode_stage, is_stale,
+                  DEBUG_PREFIX)
+from metrics import stream_metrics
+from multi_pose import MultiPoseBodyThread
+
+# magic, version, flags, frame number, capture timestamp (server clock, 0 if not synced)
+WS_FRAME_MAGIC = b'AF'
+WS_FRAME_VERSION = 1
+WS_FRAME_HEADER = struct.Struct('!2sBBId')
+
+MAX_FRAME_SIZE = 1024 * 1024
+# Messages websockets buffers per connection before it stops reading the socket, which pushes
+# back on that client through TCP without slowing anyone else down
+MAX_QUEUED_MESSAGES = 4
+
+USER_COLORS = ("#FF6B6B", "#4ECDC4", "#FFD93D", "#6C5CE7", "#A8E6CF", "#FF8B94", "#3D84A8", "#F9A826")
+
+
+class WebSocketFrameSource(DecodedFrameSource):
+    # Stands in for a UDPFrameReceiver behind a BodyThread: frames arrive whole from one connection
+    # and only the newest undecoded one is kept, so a client sending faster than we decode just
+    # has frames skipped
+    def __init__(self, stream):
+        super().__init__()
+        self.port = stream
+        self.pending = None
+        self.pending_lock = threading.Lock()
+        self.decoder = get_decode_stage()
+        self.decode_pending = False
+        self.isRunning = True
+        self.stats = StreamStats()
+        self.metrics = stream_metrics(stream)
+        self.metrics.stats = self.stats
+
+    def submit(self, jpeg, frame_id, capture_ts):
+        self.metrics.observe_age('reassembled', frame_age(capture_ts, time.time()))
+        with self.pending_lock:
+            if self.pending is not None:
+                self.stats.frames_dropped += 1
+            self.pending = (jpeg, frame_id, capture_ts)
+        self.stats.frames_completed += 1
+        self.decoder.schedule(self)
+
+    def decode_newest(self):
+        # Runs on a DecodeStage worker
+        with self.pending_lock:
+            pending, self.pending = self.pending, None
+        if pending is None:
+            return
+        jpeg, frame_id, capture_ts = pending
+        if is_stale(frame_age(capture_ts, time.time())):
+            self.metrics.inc('frames_stale')
+            return
+        try:
+            image = decode_jpeg(jpeg, self.metrics)
+        except Exception as e:
+            print(f"{DEBUG_PREFIX}Frame decode error on stream {self.port}: {e}")
+            return
+        if image is None:
+            return
+        self.metrics.observe_age('decoded', frame_age(capture_ts, time.time()))
+        self.publish_decoded(DecodedFrame(image, 0, frame_id, capture_ts))
+
+    def stop(self):
+        self.isRunning = False
+
+
+class WebSocketIngestServer:
+    # Each registered connection gets a stream number from WS_STREAM_BASE up, used as its metrics
+    # label, and a BodyThread sending its landmarks to get_output_port(stream)
+    def __init__(self, host, port, max_users=None):
+        self.host = host
+        self.port = port
+        self.max_users = max_users or global_vars.WS_MAX_USERS
+        self.free_streams = list(range(global_vars.WS_STREAM_BASE, global_vars.WS_STREAM_BASE + self.max_users))
+        self.user_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    async def handle(self, ws, path=None):
+        try:
+            registration = json.loads(await asyncio.wait_for(ws.recv(), timeout=10.0))
+        except (asyncio.TimeoutError, ValueError, TypeError):
+            await ws.close(1002, "expected a camera_feed registration")
+            return
+        if not isinstance(registration, dict) or registration.get("type") != "camera_feed":
+            await ws.send(json.dumps({"error": "expected a camera_feed registration"}))
+            return
+
+        with self.lock:
+            stream = self.free_streams.pop(0) if self.free_streams else None
+        if stream is None:
+            await ws.send(json.dumps({"error": f"server full ({self.max_users} cameras)"}))
+            return
+
+        user_id = next(self.user_ids)
+        username = str(registration.get("username") or f"User_{user_id}")[:64]
+        color = USER_COLORS[(user_id - 1) % len(USER_COLORS)]
+        output_port = global_vars.get_output_port(stream)
+        source = WebSocketFrameSource(stream)
+        if global_vars.POSE_ENGINE == "landmarker":
+            thread = MultiPoseBodyThread(stream, output_port, source)
+        else:
+            thread = BodyThread(stream, output_port, source)
+        thread.start()
+        print(f"{DEBUG_PREFIX}WebSocket camera '{username}' (user {user_id}) -> stream {stream}, output port {output_port}")
+
+        try:
+            await ws.send(json.dumps({"type": "registered", "user_id": user_id, "color": color,
+                                      "output_port": output_port, "binary_frames": True}))
+            async for message in ws:
+                if isinstance(message, bytes):
+                    self.handle_binary(source, message)
+                else:
+                    await self.handle_text(ws, source, message)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            thread.stop()
+            source.stop()
+            await asyncio.get_running_loop().run_in_executor(None, thread.join, 2.0)
+            with self.lock:
+                self.free_streams.append(stream)
+            print(f"{DEBUG_PREFIX}WebSocket camera '{username}' disconnected")
+
+    def handle_binary(self, source, message):
+        if len(message) <= WS_FRAME_HEADER.size:
+            source.stats.chunks_invalid += 1
+            return
+        magic, version, flags, frame_id, capture_ts = WS_FRAME_HEADER.unpack_from(message)
+        if magic != WS_FRAME_MAGIC or version != WS_FRAME_VERSION:
+            source.stats.chunks_invalid += 1
+            return
+        source.submit(memoryview(message)[WS_FRAME_HEADER.size:], frame_id, capture_ts)
+
+    async def handle_text(self, ws, source, message):
+        try:
+            data = json.loads(message)
+            kind = data.get("type")
+        except (ValueError, AttributeError):
+            source.stats.chunks_invalid += 1
+            return
+        if kind == "clock_ping":
+            await ws.send(json.dumps({"type": "clock_pong", "t0": data.get("t0"), "server_time": time.time()}))
+        elif kind == "frame":
+            # Base64 JSON from clients that predate binary frames. Their timestamp is in the
+            # client's own clock, never synced, so the frame's age is unknown.
+            try:
+                jpeg = base64.b64decode(data["frame"])
+                frame_id = int(data.get("frame_number", 0))
+            except (KeyError, ValueError, TypeError):
+                source.stats.chunks_invalid += 1
+                return
+            source.submit(jpeg, frame_id, 0.0)
+
+    async def serve(self):
+        async with websockets.serve(self.handle, self.host, self.port, max_size=MAX_FRAME_SIZE,
+                                    max_queue=MAX_QUEUED_MESSAGES, ping_interval=30, ping_timeout=10):
+            print(f"{DEBUG_PREFIX}WebSocket camera ingest on ws://{self.host}:{self.port}")
+            while not global_vars.KILL_THREADS:
+                await asyncio.sleep(0.5)
+
+
+def start_websocket_server(port, host=None):
+    server = WebSocketIngestServer(host or global_vars.HOST, port)
+    threading.Thread(target=asyncio.run, args=(server.serve(),), daemon=True).start()
+    return server